@@ -19,6 +19,7 @@ from gr.binder import NBinder
 from gr.log import GrLogger
 from gr.utils import format_stone_pos, resize, img_to_imgtk, dict_value2key
 from gr.grq import BoardOptimizer
+from gr.history import HISTORY_EXT
 from gr.gr import convert_xy
 
 import numpy as np
@@ -317,6 +318,9 @@ class GbrOptionsDlg(GrDialog):
                 self.qc = BoardOptimizer(board = GrBoard(), debug = False)
                 self.qc.board.image = self.root.board.image
                 self.qc.board.params = self.root.board.params
+                # Optimization history is kept next to board image
+                if self.root.board.image_file is not None:
+                    self.qc.history = os.path.splitext(self.root.board.image_file)[0] + HISTORY_EXT
                 self.last_params = self.root.board.params.todict()
                 self.resetButton.configure(state = tk.NORMAL)
                 self.qc_log = None
@@ -339,9 +343,13 @@ class GbrOptionsDlg(GrDialog):
             self.progressVar.set(0)
 
         # Run
+        # Optimization stops when perfect quality is reached
+        # Passes are evaluated in worker processes on all CPUs
         success = self.qc.optimize(groups = [1, 2],
             max_pass = self.max_iter,
-            callback = self.optimize_callback)
+            callback = self.optimize_callback,
+            jobs = None,
+            target = 0.0)
 
         # Clean up
         with self.lock:
@@ -350,8 +358,9 @@ class GbrOptionsDlg(GrDialog):
                 self.update_switches()
 
             self.optimizeButton.configure(text = "Auto-detect")
-            self.progressLabel.set("Completed {}".format("successfully"
-                if success else "unsuccessfully"))
+            self.progressLabel.set("Completed {}{}".format("successfully"
+                if success else "unsuccessfully",
+                "" if self.qc.stop_reason is None else " ({})".format(self.qc.stop_reason)))
             self.set_controls_state(tk.ACTIVE)
             self.qc_log = self.qc.log
             self.qc_thread = None
@@ -934,7 +943,7 @@ class GbrGUI2(tk.Tk):
         self.minsize(300, 400)
 
         self.log = GrLogger(self)
-        self.board = GrBoard()
+        self.board = GrBoard(parallel = True)
         self.binder = NBinder()
 
         self.internalFrame = tk.Frame(self)
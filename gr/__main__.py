@@ -0,0 +1,60 @@
+#-------------------------------------------------------------------------------
+# Name:        Go board recognition project
+# Purpose:     Command line batch recognition (python -m gr)
+#
+# Author:      kol
+#
+# Created:     18.10.2026
+# Copyright:   (c) kol 2019-2026
+# Licence:     MIT
+#-------------------------------------------------------------------------------
+import sys
+import logging
+from argparse import ArgumentParser
+from time import perf_counter
+
+from .batch import list_images, process_batch, BATCH_FORMATS
+
+def main():
+    parser = ArgumentParser(prog = 'python -m gr',
+        description = 'Recognize go board images. Recognition parameters are ' + \
+            'loaded from .gpar files stored next to images, if they exist')
+    parser.add_argument('pattern', nargs = '+',
+        help = 'Image files, directories or glob patterns (e.g. img/*.png)')
+    parser.add_argument('-j', '--jobs', type = int, default = 0,
+        help = 'Number of worker processes (0 - number of CPUs, 1 - no parallel processing)')
+    parser.add_argument('-o', '--out-dir',
+        help = 'Directory to save results to (default - next to images)')
+    parser.add_argument('-f', '--format', nargs = '+',
+        choices = BATCH_FORMATS, default = BATCH_FORMATS,
+        help = 'Output formats')
+    parser.add_argument('-v', '--verbose', action = 'count', default = 0,
+        help = 'Increase recognition logging level (-v - errors, -vv - warnings, -vvv - info)')
+    args = parser.parse_args()
+
+    log_level = [logging.CRITICAL, logging.ERROR, logging.WARNING, logging.INFO][min(args.verbose, 3)]
+    logging.basicConfig(level = log_level, format = '%(levelname)s: %(message)s')
+
+    files = list_images(args.pattern)
+    if len(files) == 0:
+        print('No images found')
+        return 1
+
+    def callback(r):
+        if r["error"] is None:
+            print("{}: {} black, {} white stones ({:.3f} sec)".format(
+                r["file"], r["black"], r["white"], r["time"]))
+        else:
+            print("{}: ERROR {}".format(r["file"], r["error"]))
+
+    t = perf_counter()
+    res = process_batch(files, jobs = args.jobs, out_dir = args.out_dir,
+        formats = args.format, callback = callback, log_level = log_level)
+
+    n_err = len([r for r in res if r["error"] is not None])
+    print("Processed {} images ({} errors) in {:.3f} sec".format(
+        len(res), n_err, perf_counter() - t))
+    return 1 if n_err > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+#-------------------------------------------------------------------------------
+# Name:        Go board recognition project
+# Purpose:     Headless batch recognition of multiple board images
+#
+# Author:      kol
+#
+# Created:     18.10.2026
+# Copyright:   (c) kol 2019-2026
+# Licence:     MIT
+#-------------------------------------------------------------------------------
+import os
+import logging
+from glob import glob
+from pathlib import Path
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from .board import GrBoard
+
+BATCH_IMG_EXT = ['.png', '.jpg', '.jpeg']   # image extensions picked up from directories
+BATCH_FORMATS = ['sgf', 'jgf']              # supported output formats
+
+def list_images(patterns):
+    """Expands list of glob patterns, directories and file names to sorted list of image files"""
+    files = set()
+    for p in patterns:
+        path = Path(p)
+        if path.is_dir():
+            files.update(x for x in path.iterdir() if x.suffix.lower() in BATCH_IMG_EXT)
+        elif path.is_file():
+            files.add(path)
+        else:
+            files.update(Path(x) for x in glob(str(p)) if Path(x).is_file())
+
+    return sorted(files, key = lambda x: str(x))
+
+def process_file(filename, out_dir = None, formats = BATCH_FORMATS):
+    """Recognizes one board image and saves results.
+
+    Parameters:
+        filename    Image file name. Recognition parameters are loaded from .gpar file, if exists
+        out_dir     Directory to save results to. If None, results are saved next to the image
+        formats     List of output formats (see BATCH_FORMATS)
+
+    Returns:
+        Dictionary with processing summary (file, params, black, white, time, outputs, error)
+    """
+    t = perf_counter()
+    r = {"file": str(filename), "params": False, "black": 0, "white": 0,
+         "time": 0.0, "outputs": [], "error": None}
+    try:
+        board = GrBoard(debug = False)
+        r["params"] = board.load_image(str(filename))
+        if board.results is None:
+            raise Exception("Board was not recognized")
+
+        r["black"] = len(board.black_stones)
+        r["white"] = len(board.white_stones)
+
+        for fmt in formats:
+            fn = None
+            if out_dir is not None:
+                fn = str(Path(out_dir).joinpath(Path(filename).stem + '.' + fmt))
+            if fmt == 'sgf':
+                r["outputs"].append(board.save_sgf(fn))
+            elif fmt == 'jgf':
+                r["outputs"].append(board.save_jgf(fn))
+            else:
+                raise ValueError("Unknown output format " + fmt)
+
+    except Exception as e:
+        logging.exception("Error processing {}".format(filename))
+        r["error"] = str(e)
+
+    r["time"] = perf_counter() - t
+    return r
+
+def _init_worker(log_level):
+    """Internal - worker process initializer"""
+    logging.basicConfig(level = log_level, format = '%(levelname)s: %(message)s')
+
+    # Every image is processed in its own process, so OpenCV internal threading
+    # would only compete with other workers for the same cores
+    cv2.setNumThreads(1)
+
+def process_batch(files, jobs = None, out_dir = None, formats = BATCH_FORMATS,
+    callback = None, log_level = logging.CRITICAL):
+    """Recognizes multiple board images in parallel.
+
+    Parameters:
+        files       List of image files (see list_images())
+        jobs        Number of worker processes. If None, number of CPUs is used.
+                    If 1, images are processed in current process.
+        out_dir     Directory to save results to. If None, results are saved next to images
+        formats     List of output formats (see BATCH_FORMATS)
+        callback    A function to be called with summary dictionary after each file has been processed
+        log_level   Logging level for recognition functions
+
+    Returns:
+        List of summary dictionaries (see process_file()) in order of files
+    """
+    if out_dir is not None:
+        Path(out_dir).mkdir(parents = True, exist_ok = True)
+    if jobs is None or jobs <= 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, max(len(files), 1))
+
+    results = dict()
+    if jobs == 1:
+        for f in files:
+            r = process_file(f, out_dir, formats)
+            results[str(f)] = r
+            if callback is not None: callback(r)
+    else:
+        with ProcessPoolExecutor(max_workers = jobs,
+            initializer = _init_worker, initargs = (log_level,)) as pool:
+
+            futures = [pool.submit(process_file, f, out_dir, formats) for f in files]
+            for fut in as_completed(futures):
+                r = fut.result()
+                results[r["file"]] = r
+                if callback is not None: callback(r)
+
+    return [results[str(f)] for f in files]
@@ -19,7 +19,7 @@ import cv2
 
 from .grdef import *
 from .gr import process_img, detect_board, generate_board
-from .utils import resize, resize2
+from .utils import resize, resize2, gres_to_jgf
 from .params import GrParams
 from .stones import GrStones
 
@@ -27,14 +27,22 @@ BOARD_PARAM_EXT = '.gpar'  # extension for board parameters file
 
 class GrBoard:
     """ Go board """
-    def __init__(self, image_file=None, board_shape=None):
+    def __init__(self, image_file=None, board_shape=None, parallel=False, debug=True):
         """ Create new instance either for image file or by generation
 
         Parameters:
             image_file       Name of image file to load
             board_shape      Generated board shape, if no image file is provided
+            parallel         If True, black and white stones are detected concurrently
+                             (see gr.process_img())
+            debug            If False, debug images are not kept with recognition results
+                             and are generated only on request (see debug_images)
 
         """
+        self.parallel = parallel
+        self.debug = debug
+        self._debug_budget = None
+        self._debug_img = None
         self._params = GrParams()
         self._stones = GrStones()
         self._res = None
@@ -74,6 +82,7 @@ class GrBoard:
         self._img = img
         self._src_img = img.copy()
         self._res = None
+        self._debug_img = None
 
         # Load params, if requested and file exists
         f_params_loaded = False
@@ -190,6 +199,28 @@ class GrBoard:
 
         return filename
 
+    def save_jgf(self, filename=None):
+        """Saves recognition results to specified file (JGF)"""
+
+        if self._res is None:
+            raise Exception("Recognition results are not available")
+
+        if filename is None:
+            filename = str(Path(self._img_file).with_suffix('.jgf'))
+
+        # Stones are taken from the board as they might have been changed after recognition
+        r = self._res.copy()
+        r[GR_STONES_B] = self.black_stones
+        r[GR_STONES_W] = self.white_stones
+        jgf = gres_to_jgf(r)
+
+        with open(str(filename), "w+") as f:
+            json.dump(jgf, f, indent=4, sort_keys=True, ensure_ascii=False,
+                default=lambda x: x.tolist() if isinstance(x, np.ndarray) else x.item())
+            f.close()
+
+        return filename
+
     def detect_edges(self):
         """Runs edges and size detection and stores result in params overriding
         BOARD_SIZE and BOARD_EDGES keys. Returns detection results."""
@@ -205,9 +236,12 @@ class GrBoard:
         """Perform recognition of board image"""
         if self._img is None or self._gen_board:
             self._res = None
+            self._debug_img = None
             self._stones.clear()
         else:
-            self._res = process_img(self._img, self._params)
+            self._res = process_img(self._img, self._params, f_parallel=self.parallel,
+                                    f_debug=self.debug)
+            self._debug_img = None
             self._stones.clear(with_forced = False)
             if self._res is not None:
                 self._stones.add_ext(self._res[GR_STONES_B], STONE_BLACK, with_forced=False,
@@ -417,14 +451,55 @@ class GrBoard:
 
     @property
     def debug_images(self):
-        """Collection of debug images generated during image recognition"""
+        """Collection of debug images generated during image recognition.
+
+        If board was processed without debug images (debug is False),
+        recognition is repeated with debug images on first request. Most of
+        processing stages are memoized (see gr.cache), so this is fast unless
+        parameters have changed.
+
+        If debug_budget is set, images are downscaled, so their total size
+        in bytes does not exceed the budget.
+        """
         if self._res is None:
             return None
-        else:
-            r = dict()
-            for key in self._res:
-                if key.find("IMG_") >= 0: r[key] = self._res[key]
-            return r
+        if self._debug_img is not None:
+            return self._debug_img
+
+        res = self._res
+        if not self.debug:
+            res = process_img(self._img, self._params, f_parallel=self.parallel)
+            if res is None:
+                return None
+
+        r = dict()
+        for key in res:
+            if key.find("IMG_") >= 0: r[key] = res[key]
+
+        # Downscale images to fit into memory budget
+        total = sum(r[key].nbytes for key in r)
+        if self.debug_budget is not None and total > self.debug_budget:
+            scale = np.sqrt(self.debug_budget / total)
+            for key in r:
+                h, w = r[key].shape[:2]
+                r[key] = cv2.resize(r[key], (max(int(w * scale), 1), max(int(h * scale), 1)),
+                                    interpolation=cv2.INTER_AREA)
+            logging.info("Debug images downscaled by {:.2f} to fit in {} bytes".format(
+                scale, self.debug_budget))
+
+        self._debug_img = r
+        return r
+
+    @property
+    def debug_budget(self):
+        """Maximum total size of debug images in bytes (None - no limit)"""
+        return self._debug_budget
+
+    @debug_budget.setter
+    def debug_budget(self, budget):
+        """Maximum total size of debug images in bytes (None - no limit)"""
+        self._debug_budget = budget
+        self._debug_img = None
 
     @property
     def debug_info(self):
@@ -0,0 +1,194 @@
+#-------------------------------------------------------------------------------
+# Name:        Go board recognition project
+# Purpose:     Memoization of intermediate image processing stages
+#
+# Author:      kol
+#
+# Created:     18.10.2026
+# Copyright:   (c) kol 2019-2026
+# Licence:     MIT
+#-------------------------------------------------------------------------------
+import logging
+import weakref
+import numpy as np
+from threading import Lock, Event, get_ident
+from collections import OrderedDict
+
+from .grdef import *
+
+# Internal function: convert parameter values to hashable form
+def _freeze(v):
+    if isinstance(v, (list, tuple)):
+        return tuple(_freeze(x) for x in v)
+    elif isinstance(v, np.ndarray):
+        return tuple(_freeze(x) for x in v.tolist())
+    elif isinstance(v, dict):
+        return tuple(sorted((k, _freeze(v[k])) for k in v))
+    else:
+        return v
+
+# Internal function: size of stage output
+def _nbytes(v, inputs):
+    if v is None or any(v is x for x in inputs):
+        return 0
+    elif isinstance(v, np.ndarray):
+        return v.nbytes
+    elif isinstance(v, (list, tuple)):
+        return sum(_nbytes(x, inputs) for x in v)
+    else:
+        return 0
+
+# Internal function: make a weak reference to stage input
+def _ref(x):
+    try:
+        return weakref.ref(x)
+    except TypeError:
+        # None or other object which could not be referenced,
+        # it will be checked by value
+        return lambda: x
+
+class GrStageCache(object):
+    """Memoization cache for image processing stages.
+
+    Image processing is organized as a graph of stages where every stage takes some
+    inputs (images or arrays produced by other stages) and a set of parameters.
+    A stage output is memoized on identity of its inputs and values of parameters the stage
+    depends on, so if a parameter is changed, only stages which depend on it
+    (and stages which depend on their outputs) are recalculated.
+
+    Since cached outputs are returned as they are, stage functions must never modify
+    their inputs in place.
+
+    Log records produced by a stage are saved along with its output and
+    re-emitted when a cached output is returned, so log-based checks
+    (see grq.BoardOptimizer) see the same messages.
+
+    If a stage is requested while the same stage with the same inputs and parameters
+    is being run by another thread (for example, a shared pre-filter of
+    black and white stones detection running concurrently), the request waits
+    for its output instead of running the stage again.
+
+    The cache has a limit of total size of cached arrays. When it is exceeded,
+    least recently used outputs are evicted. Set max_size to 0 to disable caching.
+    """
+
+    class LogCapture(logging.Handler):
+        """Enclosed log handler saving log records of current thread"""
+        def __init__(self):
+            logging.Handler.__init__(self)
+            self.thread = get_ident()
+            self.records = []
+
+        def emit(self, record):
+            if record.thread == self.thread:
+                self.records.append(record)
+
+    def __init__(self, max_size = DEF_STAGE_CACHE_SIZE):
+        """Constructor
+
+        Parameters:
+            max_size    Maximum size of cached arrays in bytes
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__cache = OrderedDict()
+        self.__size = 0
+        self.__lock = Lock()
+        self.__running = dict()
+
+    @property
+    def size(self):
+        """Total size of cached arrays"""
+        return self.__size
+
+    def __len__(self):
+        return len(self.__cache)
+
+    def clear(self):
+        """Remove all cached outputs"""
+        with self.__lock:
+            self.__cache.clear()
+            self.__size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def run(self, stage, inputs, params, fun):
+        """Get a stage output either from cache or by running a stage function.
+
+        Parameters:
+            stage       Stage name
+            inputs      List of stage inputs (images, arrays or None)
+            params      List of parameter values the stage depends on
+            fun         Function with no arguments calculating stage output
+
+        Returns:
+            Stage output
+        """
+        if not self.max_size:
+            return fun()
+
+        key = (stage, tuple(id(x) for x in inputs), _freeze(params))
+
+        while True:
+            with self.__lock:
+                entry = self.__cache.get(key)
+                if entry is not None:
+                    refs, value, records, nbytes = entry
+                    if all(r() is x for r, x in zip(refs, inputs)):
+                        self.__cache.move_to_end(key)
+                        self.hits += 1
+                    else:
+                        # Input objects were released and their ids reused
+                        del self.__cache[key]
+                        self.__size -= nbytes
+                        entry = None
+
+                running = self.__running.get(key) if entry is None else None
+                if entry is None and running is None:
+                    self.__running[key] = Event()
+                    break
+
+            if entry is not None:
+                for r in records:
+                    logging.getLogger(r.name).handle(r)
+                return value
+
+            # Same stage is being run by another thread
+            running.wait()
+
+        # Run the stage capturing log output
+        capture = self.LogCapture()
+        root = logging.getLogger()
+        root.addHandler(capture)
+        try:
+            value = fun()
+        except:
+            with self.__lock:
+                self.__running.pop(key).set()
+            raise
+        finally:
+            root.removeHandler(capture)
+
+        nbytes = _nbytes(value, inputs)
+        with self.__lock:
+            running = self.__running.pop(key)
+            if nbytes > self.max_size:
+                running.set()
+                return value
+
+            self.misses += 1
+            if key in self.__cache:
+                self.__size -= self.__cache[key][3]
+            self.__cache[key] = (tuple(_ref(x) for x in inputs), value, capture.records, nbytes)
+            self.__size += nbytes
+
+            while self.__size > self.max_size and len(self.__cache) > 0:
+                _, entry = self.__cache.popitem(last = False)
+                self.__size -= entry[3]
+            running.set()
+
+        return value
+
+# Default cache instance used by recognition functions
+stage_cache = GrStageCache()
@@ -13,10 +13,82 @@ import cv2
 import numpy as np
 import logging
 
+PEAK_SEARCH_RADIUS = 5      # radius to look for a peak around stone center
+MARKER_BAND_ROWS = 64       # number of image rows processed at once when looking for markers
+MAX_STONE_RADIUS = 20.0     # default maximum stone radius
+
+# Internal function: find peaks for stones
+def _find_peaks(thresh, stones):
+    """Find peak points for stones on thresholded image.
+    If stone center falls to a black point, nearest white point within
+    PEAK_SEARCH_RADIUS is taken. Returns array of (x, y) or (-1, -1) if no white point found"""
+    r = PEAK_SEARCH_RADIUS
+    xy = np.asarray(stones)[:, :2].astype(np.int64)
+
+    # Windows around every stone on padded image
+    # Stones too far outside the image are not looked for
+    inside = (xy[:, 0] >= -r) & (xy[:, 1] >= -r) & \
+             (xy[:, 0] < thresh.shape[1] + r) & (xy[:, 1] < thresh.shape[0] + r)
+    cx = np.clip(xy[:, 0], -r, thresh.shape[1] + r - 1) + 2*r
+    cy = np.clip(xy[:, 1], -r, thresh.shape[0] + r - 1) + 2*r
+    padded = cv2.copyMakeBorder(thresh, 2*r, 2*r, 2*r, 2*r, cv2.BORDER_CONSTANT, value = 0)
+    d = np.arange(-r, r + 1)
+    win = padded[cy[:, None, None] + d[None, :, None], cx[:, None, None] + d[None, None, :]]
+
+    # Squared distances to window points, center point comes first
+    dist = (d[:, None] ** 2 + d[None, :] ** 2).astype(np.float64)
+    dist = np.where(win > 0, dist[None], np.inf).reshape(len(xy), -1)
+    n = np.argmin(dist, axis = 1)
+    found = inside & np.isfinite(dist[np.arange(len(xy)), n])
+
+    peaks = np.full((len(xy), 2), -1, dtype = np.int64)
+    peaks[found, 0] = xy[found, 0] + d[n[found] % (2*r + 1)]
+    peaks[found, 1] = xy[found, 1] + d[n[found] // (2*r + 1)]
+    return peaks
+
+# Internal function: bounding boxes of watershed markers
+def _marker_boxes(markers):
+    """Returns a list of (marker, (x0, y0, x1, y1)) for all positive markers"""
+    # Markers cover almost all image, so the image is processed by bands of rows
+    # to limit size of temporary arrays. Pixel indexes of a band are sorted by marker,
+    # and since indexes of every marker are ascending, Y range is given
+    # by the first and the last index
+    h, w = markers.shape
+    n = int(markers.max()) if markers.size > 0 else 0
+    if n <= 0:
+        return []
+
+    x0, y0 = np.full(n + 1, w), np.full(n + 1, h)
+    x1, y1 = np.full(n + 1, -1), np.full(n + 1, -1)
+    for b in range(0, h, MARKER_BAND_ROWS):
+        flat = markers[b:b + MARKER_BAND_ROWS].ravel()
+        idx = np.argsort(flat, kind = 'stable')
+        labels = flat[idx]
+        first = np.searchsorted(labels, 1)
+        if first == len(labels):
+            continue
+
+        idx, labels = idx[first:], labels[first:]
+        starts = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+        ends = np.r_[starts - 1, len(labels) - 1]
+        starts = np.r_[0, starts]
+        c = labels[starts]
+        y0[c] = np.minimum(y0[c], idx[starts] // w + b)
+        y1[c] = np.maximum(y1[c], idx[ends] // w + b)
+
+        xs = np.remainder(idx, w, out = idx)
+        x0[c] = np.minimum(x0[c], np.minimum.reduceat(xs, starts))
+        x1[c] = np.maximum(x1[c], np.maximum.reduceat(xs, starts))
+
+    found = np.flatnonzero(x1 >= 0)
+    return zip(found.tolist(), zip(x0[found].tolist(), y0[found].tolist(),
+        x1[found].tolist(), y1[found].tolist()))
+
+
 # Apply watershed transformation
 # The algorithm derived from OpenCV's publication 'Image Segmentation with Watershed Algorithm'
 # and adopted to use stone coordinations as an indicators of peaks instead of original "max peak value" method
-def apply_watershed(gray, stones, n_thresh, f_bw, n_morph = 0, f_debug = False):
+def apply_watershed(gray, stones, n_thresh, f_bw, n_morph = 0, max_radius = MAX_STONE_RADIUS, f_debug = False):
     """Apply watershed transformation to given board image.
 
     gray        source image (either gray or one of channels)
@@ -24,6 +96,7 @@ def apply_watershed(gray, stones, n_thresh, f_bw, n_morph = 0, f_debug = False):
     n_thresh    threshold level
     f_bw        either B for black stones or W for white
     n_morph     number of iterations of morphological transformation (0 if not needed)
+    max_radius  maximum radius of a stone, larger areas are ignored
     f_debug     if True, debug images are to be shown with cv2.imshow() call
 
     Returns     array of stones in X,Y,R format and a debug image with stones plotted
@@ -55,33 +128,17 @@ def apply_watershed(gray, stones, n_thresh, f_bw, n_morph = 0, f_debug = False):
     #stones = stones[b].reshape(1, stones.shape[1])
 
     # Prepare peaks map
-    peaks = np.zeros(thresh.shape, dtype = np.uint8)
-    for i in range(len(stones)):
-        x = int(stones[i,0])
-        y = int(stones[i,1])
-
-        if x >= 0 and y >= 0 and x < thresh.shape[1] and y < thresh.shape[0] and thresh[y,x] > 0:
-           #cv2.circle(peaks, (x,y), 1, (i+1), -1)
-           peaks[y,x] = (i+1)
-        else:
-           # Circle center falls to a black point
-           # Look around to find a white point within small radius
-           r = 5
-           r2 = r*2
-           f = False
-           for dy in range(r2+1):
-               for dx in range(r2+1):
-                   vy = y+r-dy
-                   vx = x+r-dx
-                   if vx >= 0 and vy >= 0 and vx < thresh.shape[1] and vy < thresh.shape[0] and thresh[vy, vx] > 0:
-                      f = True
-                      #cv2.circle(peaks, (x+r2-dx,y+r2-dy), 1, (i+1), -1)
-                      peaks[vy, vx] = (i+1)
-                      break
-               if f: break
-           if not f:
-              # No white found. Ignore the stone, but save a warning
-              logging.warning('WATERSHED: Cannot find peak for stone ({},{},{})'.format(x,y,r))
+    # Markers are numbered starting from 1 in order of stones
+    peaks = np.zeros(thresh.shape, dtype = np.int32)
+    if len(stones) > 0:
+        peaks_xy = _find_peaks(thresh, stones)
+        for i in np.flatnonzero(peaks_xy[:, 0] < 0):
+            # No white found. Ignore the stone, but save a warning
+            logging.warning('WATERSHED: Cannot find peak for stone ({},{},{})'.format(
+                int(stones[i,0]), int(stones[i,1]), PEAK_SEARCH_RADIUS))
+
+        found = np.flatnonzero(peaks_xy[:, 0] >= 0)
+        peaks[peaks_xy[found, 1], peaks_xy[found, 0]] = found + 1
 
     if f_debug:
        m = np.zeros((thresh.shape[0],thresh.shape[1],3), dtype = np.uint8)
@@ -128,9 +185,8 @@ def apply_watershed(gray, stones, n_thresh, f_bw, n_morph = 0, f_debug = False):
 ##    cv2.watershed(img3, markers)
 
     # Apply watershed
-    markers = peaks.astype(np.int32)
-    img3 = np.empty((gray.shape[0], gray.shape[1], 3), dtype=np.uint8)
-    for i in range(3): img3[:,:,i] = thresh
+    markers = peaks
+    img3 = cv2.cvtColor(thresh, cv2.COLOR_GRAY2BGR)
     cv2.watershed(img3, markers)
 
     if f_debug:
@@ -142,21 +198,24 @@ def apply_watershed(gray, stones, n_thresh, f_bw, n_morph = 0, f_debug = False):
        cv2.imshow('Borders', m)
 
     # Collect results
+    # Bounding boxes of all markers are found at once, so contours are
+    # looked for only within a small area around each marker
     dst = np.zeros(gray.shape, dtype=np.uint8)
     rt = []
-    for c in np.unique(markers):
-        if c <= 0: continue
-        mask = np.zeros(markers.shape, dtype=np.uint8)
-        mask[markers == c] = 255
+    for c, (x0, y0, x1, y1) in _marker_boxes(markers):
+        x0, y0 = max(x0 - 1, 0), max(y0 - 1, 0)
+        x1, y1 = min(x1 + 2, markers.shape[1]), min(y1 + 2, markers.shape[0])
+        mask = (markers[y0:y1, x0:x1] == c).astype(np.uint8) * 255
+
         if cv2.__version__.startswith('3'):
-            cnts = cv2.findContours(mask.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[1]
+            cnts = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset = (x0, y0))[1]
         else:
-            cnts = cv2.findContours(mask.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]
+            cnts = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset = (x0, y0))[0]
         cm = max(cnts, key=cv2.contourArea)
         ((x, y), r) = cv2.minEnclosingCircle(cm)
         if f_debug: logging.info("CV2_WATERSHED: marker {}: ({}, {}, {})".format(c,x,y,r))
 
-        if r > 20.0:
+        if r > max_radius:
             logging.info("WATERSHED: Ignoring marker {}: ({}, {}, {})".format(c,x,y,r))
         else:
            # Increase radius to number of pixels removed with erode/dilate
@@ -12,12 +12,17 @@
 import cv2
 import numpy as np
 import logging
-from itertools import accumulate
 from copy import deepcopy
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
 
 from .grdef import *
 from .utils import *
-from .cv2_watershed import apply_watershed
+from .cv2_watershed import apply_watershed, MAX_STONE_RADIUS
+from .cache import stage_cache
+from .grid import detect_grid, grid_lines, estimate_grid, grid_filter_lines, \
+    MIN_GRID_CONFIDENCE, MIN_PERIOD_STRENGTH
+from .sampling import stones_integral, sample_stones, match_stones, box_mean
 
 # Internal function: draw a board grid
 def draw_board_grid(img, edges, board_size, space_x, space_y, color = COLOR_BLACK):
@@ -56,15 +61,20 @@ def find_stones(src_img, params, res, f_bw):
     """
 
     # Pre-filter: pyramid filtering
+    # Mode 1 runs mean shift on full image, mode 2 runs it on downscaled image and upsamples results
     def _apply_pmf(img, params, f_bw):
         n_pmf = params['PYRAMID_' + f_bw]
         if n_pmf == 0:
            logging.info("Filter skipped")
            return img
+        elif n_pmf == 1 or min(img.shape[:2]) * PMF_FAST_SCALE < PMF_MIN_SIZE:
+            return cv2.pyrMeanShiftFiltering(img, PMF_SPATIAL_RADIUS, PMF_COLOR_RADIUS)
         else:
-            pmf = cv2.pyrMeanShiftFiltering(img, 21, 51)
-            res['IMG_PMF_' + f_bw] = pmf
-            return pmf
+            small = cv2.resize(img, None, fx = PMF_FAST_SCALE, fy = PMF_FAST_SCALE,
+                interpolation = cv2.INTER_AREA)
+            small = cv2.pyrMeanShiftFiltering(small,
+                max(int(PMF_SPATIAL_RADIUS * PMF_FAST_SCALE), 1), PMF_COLOR_RADIUS)
+            return cv2.resize(small, (img.shape[1], img.shape[0]), interpolation = cv2.INTER_LINEAR)
 
     # Pre-filter: gray out
     def _apply_gray(img, params, f_bw):
@@ -72,11 +82,7 @@ def find_stones(src_img, params, res, f_bw):
 
     # Pre-filter: extract channel
     def _apply_channel_mask(img, params, f_bw):
-        b,g,r = cv2.split(img)
-        if f_bw == 'B':
-           return r
-        else:
-           return b
+        return cv2.extractChannel(img, 2 if f_bw == 'B' else 0)
 
     # Pre-filter: thresholding
     def _apply_thresh(img, params, f_bw):
@@ -86,7 +92,6 @@ def find_stones(src_img, params, res, f_bw):
         if f_bw == 'W': method = cv2.THRESH_BINARY_INV
 
         ret, thresh = cv2.threshold(img, n_thresh, n_maxval, method)
-        res['IMG_THRESH_' + f_bw] = thresh
         return thresh
 
     # Pre-filter: dilation
@@ -97,8 +102,7 @@ def find_stones(src_img, params, res, f_bw):
            logging.info("Filter skipped")
            return img
         else:
-           kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,(100,100))
-           kernel = cv2.resize(kernel, (n_mask,n_mask))
+           kernel = ellipse_kernel(n_mask)
            return cv2.dilate(img, kernel,
                                   iterations=n_iter,
                                   borderType = cv2.BORDER_CONSTANT,
@@ -113,8 +117,7 @@ def find_stones(src_img, params, res, f_bw):
            logging.info("Filter skipped")
            return img
         else:
-           kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,(100,100))
-           kernel = cv2.resize(kernel, (n_mask,n_mask))
+           kernel = ellipse_kernel(n_mask)
            return cv2.erode(img, kernel,
                                   iterations=n_iter,
                                   borderType = cv2.BORDER_CONSTANT,
@@ -139,30 +142,74 @@ def find_stones(src_img, params, res, f_bw):
             # Convert to LAB color space
             lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
 
-            # Split channels
-            l, a, b = cv2.split(lab)
-
             # Apply CLAHE to l_channel
+            l = cv2.extractChannel(lab, 0)
             clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-            cl = clahe.apply(l)
+            clahe.apply(l, dst = l)
 
-            # Merge back and convert to RGB color space
-            merged = cv2.merge((cl,a,b))
-            final = cv2.cvtColor(merged, cv2.COLOR_LAB2BGR)
-            return final
+            # Put it back and convert to RGB color space
+            cv2.insertChannel(l, lab, 0)
+            return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
 
     # Post-filter: houghCircle
+    # Post-filters return found stones and optional debug image
     def _apply_houghc(img, filtered_img, params, f_bw, prev_stones):
-        n_mindist = params['HC_MINDIST']
-        n_maxrad = params['HC_MAXRADIUS']
+        if params['DIST_TRANSFORM_' + f_bw]:
+           logging.info("Filter skipped")
+           return None, None
+
+        n_mindist, n_minrad, n_maxrad = _hough_sizes(params)
         n_param2 = params['HC_SENSITIVITY_' + f_bw]
         return cv2.HoughCircles(filtered_img, cv2.HOUGH_GRADIENT,
                                        1,
                                        minDist = n_mindist,
                                        param1 = 100,
                                        param2 = n_param2,
-                                       #minRadius = 3,
-                                       maxRadius = n_maxrad)
+                                       minRadius = n_minrad,
+                                       maxRadius = n_maxrad), None
+
+    # Utility: HoughCircles distance and radius limits
+    # In auto mode, limits are derived from board spacing, HC_MINDIST and HC_MAXRADIUS
+    # are not used. Non-zero HC_AUTO_MINDIST and HC_AUTO_MAXRADIUS override derived limits
+    def _hough_sizes(params):
+        n_mindist = params['HC_MINDIST']
+        n_maxrad = params['HC_MAXRADIUS']
+        n_minrad = 0
+        if params.get('HC_AUTO') and res.get(GR_SPACING) is not None:
+            space = min(res[GR_SPACING])
+            n_minrad = max(int(space * HC_AUTO_MIN_RADIUS), 1)
+            n_mindist = params.get('HC_AUTO_MINDIST') or max(int(space * HC_AUTO_MIN_DIST), 1)
+            n_maxrad = params.get('HC_AUTO_MAXRADIUS') or \
+                max(int(round(space * HC_AUTO_MAX_RADIUS)), n_minrad + 1)
+            n_minrad = min(n_minrad, n_maxrad - 1)
+            logging.info("HoughCircles distance {}, radius {}..{}".format(n_mindist, n_minrad, n_maxrad))
+        return n_mindist, n_minrad, n_maxrad
+
+    # Post-filter: distance transform (experimental)
+    # Stone centers are local maximums of distance to background on morphed image
+    # within a window tied to board spacing, and the distance is a stone radius.
+    # Too low peaks (noise, image border) are ignored.
+    # Results differ from HoughCircles ones noticeably, especially on empty boards
+    def _apply_dist_transform(img, filtered_img, params, f_bw, prev_stones):
+        n_dt = params['DIST_TRANSFORM_' + f_bw]
+        if n_dt == 0:
+           logging.info("Filter skipped")
+           return None, None
+        else:
+           space = min(res[GR_SPACING])
+           n_sep = max(int(space * DT_PEAK_WINDOW), 1)
+
+           # Stones are dark on morphed image
+           mask = cv2.compare(filtered_img, 127, cv2.CMP_LE)
+           dist = cv2.distanceTransform(mask, cv2.DIST_L2, 5)
+           kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (n_sep, n_sep))
+           peaks = (dist >= cv2.dilate(dist, kernel)) & (dist >= space * DT_MIN_RADIUS)
+
+           y, x = np.nonzero(peaks)
+           dbg_img = cv2.normalize(dist, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+           if len(x) == 0:
+              return None, dbg_img
+           return np.column_stack((x, y, dist[y, x])), dbg_img
 
     # Post-filter: watershed
     def _apply_watershed(img, filtered_img, params, f_bw, prev_stones):
@@ -170,93 +217,239 @@ def find_stones(src_img, params, res, f_bw):
 
         if n_ws == 0 or prev_stones is None:
            logging.info("Filter skipped")
-           return None
+           return None, None
         else:
            #gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
            gray = _apply_channel_mask(img, params, f_bw)
            n_thresh = n_ws
            n_morph = params['WS_MORPH_' + f_bw]
 
-           ws_stones, ws_img = apply_watershed(gray = gray, stones = prev_stones, \
-                      n_thresh = n_thresh, f_bw = f_bw, n_morph = n_morph)
+           # Maximum stone size is tied to board spacing, if it is known
+           n_maxrad = min(res[GR_SPACING]) * WS_MAX_RADIUS if res.get(GR_SPACING) is not None else MAX_STONE_RADIUS
+
+           return apply_watershed(gray = gray, stones = prev_stones, \
+                      n_thresh = n_thresh, f_bw = f_bw, n_morph = n_morph, max_radius = n_maxrad)
 
-           res['IMG_WATERSHED_' + f_bw] = ws_img
-           return ws_stones
+    # Post-filter: template matching
+    def _apply_template(img, filtered_img, params, f_bw, prev_stones):
+        n_match = params['TEMPLATE_' + f_bw]
+
+        if n_match == 0 or prev_stones is None:
+           logging.info("Filter skipped")
+           return None, None
+        else:
+           channel = _apply_channel_mask(img, params, f_bw)
+           return match_stones(channel, prev_stones, res, n_match / 100.0)
 
     # Utility: combine stones from two arrays
-    def _combine_stones(prev_stones, new_stones):
+    # Stones from previous array are replaced by new stones at the same position
+    # unless new stone radius is too small.
+    # If f_add is True, new stones at other positions are added too
+    def _combine_stones(prev_stones, new_stones, f_add = False):
         if new_stones is None or len(new_stones) == 0:
            return prev_stones
         if prev_stones is None or len(prev_stones) == 0:
            return new_stones
+        if f_add:
+           size = stones_grid_size(prev_stones, new_stones)
+           occupied = np.zeros(size * size, dtype = np.bool_)
+           occupied[stones_grid_index(prev_stones, size)] = True
+           added = new_stones[~occupied[stones_grid_index(new_stones, size)]]
+           if len(added) == 0:
+              return prev_stones
+           stones = np.concatenate((prev_stones, added))
+           return stones[np.argsort(stones_grid_index(stones, size), kind = 'stable')]
+
+        min_r = np.sum(new_stones[:, GR_R]) / float(len(new_stones) * 2)
+        new_stones = new_stones[new_stones[:, GR_R] >= min_r]
+
+        # Map positions of new stones to their indices on a board grid
+        size = stones_grid_size(prev_stones, new_stones)
+        grid = np.full(size * size, -1, dtype = np.int64)
+        grid[stones_grid_index(new_stones, size)[::-1]] = np.arange(len(new_stones))[::-1]
+
+        n = grid[stones_grid_index(prev_stones, size)]
+        return np.where((n >= 0)[:, None], new_stones[np.maximum(n, 0)], prev_stones)
+
+    # Utility: convert stones found by a post-filter and combine them with previous ones
+    def _convert_stones(prev_stones, new_stones, f_add = False):
+        if new_stones is None:
+           logging.info("No new stones found, stopping")
+           return prev_stones
+        else:
+           if len(new_stones.shape) == 3: new_stones = new_stones[0]
+           logging.info("Filter found {} stones".format(len(new_stones)))
 
-        st_res = []
-        min_r = sum([i[4] for i in new_stones]) / float(len(new_stones) * 2)
-        for s1 in prev_stones:
-            found = False
-            for s2 in new_stones:
-                if s1[GR_A] == s2[GR_A] and s1[GR_B] == s2[GR_B] and s2[GR_R] >= min_r:
-                   st_res.append(s2)
-                   found = True
-                   break
-            if not found:
-                st_res.append(s1)
-
-        return np.array(st_res)
+           conv_stones = convert_xy(new_stones, res)
+           return _combine_stones(prev_stones, conv_stones, f_add)
 
     # Initialize filters
+    # Every filter is defined by a function, list of parameters it depends on
+    # and a key to save filter results in results dictionary
     def _init():
         return ({
-            "PMF": _apply_pmf,
-            'LUM_EQ': _apply_clahe,
-            "CHANNEL": _apply_channel_mask,
-            #"GRAY": _apply_gray,
-            "THRESH": _apply_thresh,
-            "STONES_DILATE": _apply_dilate,
-            "STONES_ERODE": _apply_erode,
-            "BLUR_MASK": _apply_blur
+            "PMF": (_apply_pmf, ['PYRAMID_' + f_bw], 'IMG_PMF_' + f_bw),
+            'LUM_EQ': (_apply_clahe, ['LUM_EQ'], None),
+            "CHANNEL": (_apply_channel_mask, [], None),
+            #"GRAY": (_apply_gray, [], None),
+            "THRESH": (_apply_thresh, ['STONES_THRESHOLD_' + f_bw, 'STONES_MAXVAL_' + f_bw], 'IMG_THRESH_' + f_bw),
+            "STONES_DILATE": (_apply_dilate, ['STONES_DILATE_' + f_bw, 'HC_MASK_' + f_bw], None),
+            "STONES_ERODE": (_apply_erode, ['STONES_ERODE_' + f_bw, 'HC_MASK_' + f_bw], None),
+            "BLUR_MASK": (_apply_blur, ['BLUR_MASK_' + f_bw], None)
         },
         {
-            "HOUGH_C": _apply_houghc,
-            "WATERSHED": _apply_watershed
+            "HOUGH_C": (_apply_houghc, ['HC_MINDIST', 'HC_MAXRADIUS', 'HC_AUTO', 'HC_AUTO_MINDIST', 'HC_AUTO_MAXRADIUS',
+                'HC_SENSITIVITY_' + f_bw, 'DIST_TRANSFORM_' + f_bw], None),
+            "DIST_TRANSFORM": (_apply_dist_transform, ['DIST_TRANSFORM_' + f_bw], 'IMG_DIST_' + f_bw),
+            "WATERSHED": (_apply_watershed, ['WATERSHED_' + f_bw, 'WS_MORPH_' + f_bw], 'IMG_WATERSHED_' + f_bw),
+            "TEMPLATE": (_apply_template, ['TEMPLATE_' + f_bw], 'IMG_TEMPLATE_' + f_bw)
         })
 
+    # Pre-filters which do not depend on stones color
+    # Their outputs are shared by black and white stones detection
+    shared_filters = ['PMF', 'LUM_EQ']
+
+    # Post-filters which find stones missed by previous filters
+    # rather than refine stones already found
+    add_filters = ['TEMPLATE']
+
+    # Post-filters which use board geometry
+    geometry_filters = ['DIST_TRANSFORM', 'WATERSHED', 'TEMPLATE']
+    if params.get('HC_AUTO'): geometry_filters.append('HOUGH_C')
+
+    # Intersection sampling engine
+    # Stones are found by sampling thresholded image at grid intersections, filters are not used
+    if params.get('STONES_SAMPLING'):
+        n_thresh = params['STONES_THRESHOLD_' + f_bw]
+        logging.info("Sampling intersections for color {}".format(f_bw))
+        sums = stage_cache.run('SAMPLE_' + f_bw, [src_img], [n_thresh],
+            lambda: stones_integral(src_img, f_bw, n_thresh))
+        stones = sample_stones(sums, res)
+
+        n_stones = stones.shape[0] if stones is not None else 0
+        logging.info("Stones found: {} of color {}".format(n_stones, f_bw))
+        return stones
+
     # Set up filters list
     (pre_filters, post_filters) = _init()
 
     # Process image with pre-filters
-    filtered_img = src_img.copy()
+    # Each filter output is memoized, so only filters depending on changed parameters
+    # and filters following them are actually run
+    filtered_img = src_img
     for f in pre_filters:
+        fun, keys, res_key = pre_filters[f]
         logging.info("Applying pre-filter {} for color {}".format(f, f_bw))
-        filtered_img = pre_filters[f](filtered_img, params, f_bw)
+        prev_img = filtered_img
+        stage = f if f in shared_filters else f + '_' + f_bw
+        filtered_img = stage_cache.run(stage, [prev_img], [params[k] for k in keys],
+            lambda: fun(prev_img, params, f_bw))
+        if res_key is not None and filtered_img is not prev_img:
+            res[res_key] = filtered_img
     res['IMG_MORPH_' + f_bw] = filtered_img
 
     # Process image with post-filters
+    # Stones conversion depends on board geometry
+    geometry = [res.get(GR_EDGES), res.get(GR_BOARD_SIZE), res.get(GR_SPACING)]
     stones = None
     for f in post_filters:
+        fun, keys, res_key = post_filters[f]
         logging.info("Applying post-filter {} for color {}".format(f, f_bw))
-        new_stones = post_filters[f](src_img, filtered_img, params, f_bw, stones)
-        if new_stones is None:
-           logging.info("No new stones found, stopping")
-        else:
-           if len(new_stones.shape) == 3: new_stones = new_stones[0]
-           logging.info("Filter found {} stones".format(len(new_stones)))
-
-           conv_stones = convert_xy(new_stones, res)
-           stones = _combine_stones(stones, conv_stones)
+        prev_stones = stones
+        f_params = [params[k] for k in keys]
+        if f in geometry_filters: f_params.append(geometry)
+        new_stones, dbg_img = stage_cache.run(f + '_' + f_bw,
+            [src_img, filtered_img, prev_stones], f_params,
+            lambda: fun(src_img, filtered_img, params, f_bw, prev_stones))
+        if res_key is not None and dbg_img is not None:
+            res[res_key] = dbg_img
+
+        stones = stage_cache.run(f + '_CONV_' + f_bw, [new_stones, prev_stones], geometry,
+            lambda: _convert_stones(prev_stones, new_stones, f in add_filters))
 
     n_stones = stones.shape[0] if stones is not None else 0
     logging.info("Stones found: {} of color {}".format(n_stones, f_bw))
-    return stones
+
+    # Stones array is memoized and should not be changed by the caller
+    return stones.copy() if stones is not None else None
+
+# Find black and white stones in one pass
+def find_stones_joint(src_img, params, res):
+    """Find black and white stones in one pass.
+
+    Stone candidates are found once with HoughCircles on blurred grayscale image,
+    which does not depend on stones color. Then every candidate is assigned a color
+    by sampling thresholded red (black stones) and blue (white stones) channels
+    inside its circle. Candidates of neither color are dropped.
+    Thresholded channels are saved as morphed images, as find_stones() does.
+
+       Parameters:
+           src_img    An image to process
+           params     Recognition parameters (see grdef.DEF_GR_PARAMS)
+           res        Results dictionary (see grdef.GR_xxx)
+       Returns:
+            lists of black and white stones in form of (X, Y, A, B, R)
+    """
+    space = min(res[GR_SPACING])
+
+    # Blurring removes board lines and texture
+    n_blur = max(int(space * JOINT_BLUR) | 1, 3)
+    gray = stage_cache.run('JOINT_GRAY', [src_img], [n_blur],
+        lambda: cv2.GaussianBlur(cv2.cvtColor(src_img, cv2.COLOR_BGR2GRAY), (n_blur, n_blur), 0))
+
+    # Thresholded channels, stones are black on them
+    thresh = dict()
+    for f_bw in (STONE_BLACK, STONE_WHITE):
+        n_thresh = params['STONES_THRESHOLD_' + f_bw]
+        method = cv2.THRESH_BINARY if f_bw == STONE_BLACK else cv2.THRESH_BINARY_INV
+        thresh[f_bw] = stage_cache.run('JOINT_THRESH_' + f_bw, [src_img], [n_thresh],
+            lambda: cv2.threshold(cv2.extractChannel(src_img, 2 if f_bw == STONE_BLACK else 0),
+                                  n_thresh, 255, method)[1])
+        res['IMG_MORPH_' + f_bw] = thresh[f_bw]
+
+    # Stone candidates
+    n_param2 = params['STONES_JOINT']
+    n_mindist = max(int(space * HC_AUTO_MIN_DIST), 1)
+    n_minrad = max(int(space * JOINT_MIN_RADIUS), 1)
+    n_maxrad = max(int(space * HC_AUTO_MAX_RADIUS), n_minrad + 1)
+    logging.info("Finding stone candidates")
+    circles = stage_cache.run('JOINT_HOUGH', [gray], [n_param2, n_mindist, n_minrad, n_maxrad],
+        lambda: cv2.HoughCircles(gray, cv2.HOUGH_GRADIENT, 1,
+                                 minDist = n_mindist,
+                                 param1 = 100,
+                                 param2 = n_param2,
+                                 minRadius = n_minrad,
+                                 maxRadius = n_maxrad))
+    if circles is None:
+        logging.info("No stone candidates found")
+        return None, None
+    circles = circles[0]
+
+    # Part of a box inscribed in every circle covered by stone colors
+    half = np.maximum((circles[:, 2] * 0.6).astype(np.int64), 1)
+    fill = dict()
+    for f_bw in (STONE_BLACK, STONE_WHITE):
+        sums = stage_cache.run('JOINT_SUMS_' + f_bw, [thresh[f_bw]], [],
+            lambda: cv2.integral(thresh[f_bw], sdepth = cv2.CV_32S))
+        fill[f_bw] = 1.0 - box_mean(sums, circles, half) / 255.0
+
+    # Priority for white stones as in eliminate_duplicates()
+    is_white = fill[STONE_WHITE] >= JOINT_MIN_FILL
+    is_black = (fill[STONE_BLACK] >= JOINT_MIN_FILL) & ~is_white
+    logging.info("Stone candidates: {}, black: {}, white: {}".format(
+        len(circles), np.sum(is_black), np.sum(is_white)))
+
+    return convert_xy(circles[is_black], res), convert_xy(circles[is_white], res)
 
 # Find board edges, spacing and size
-def find_board(img, params, res):
+def find_board(img, params, res, f_debug = True):
     """Determine board parameters
 
        Parameters
            img         An image
            params      Recognition parameters (see grdef.DEF_GR_PARAMS)
            res         Results dictionary (see grdef.GR_xxx)
+           f_debug     If False, debug images with board lines are not generated
        Returns
            edges list of lists [[x1,y1], [x2,y2]]
            size integer
@@ -264,55 +457,172 @@ def find_board(img, params, res):
 
     MIN_LINE_SPACE = 10
 
+    # Coarse-to-fine detection, if requested
+    # Levels are reduced so the downscaled image is not too small. On small images
+    # downscaling and edges refinement take longer than detection on full image
+    levels = params.get('BOARD_PYRAMID') or 0
+    while levels > 0 and min(img.shape[:2]) // (2 ** levels) < MIN_PYRAMID_SIZE:
+        levels -= 1
+    if levels > 0:
+        return _find_board_pyramid(img, params, res, levels, f_debug)
+
     def houghp_to_lines(lines):
         """ Transform HoughP results to lines array """
-        ret = []
-        if not lines is None:
-            for i in lines:
-                ret.append(((i[0][0],i[0][1]),(i[0][2],i[0][3])))
-        return np.array(ret)
+        if lines is None:
+            return np.empty((0, 2, 2), dtype = np.int32)
+        return lines.reshape(-1, 2, 2)
 
     def hough_to_lines(lines, shape):
         """ Transform Hough results to lines array"""
-        ret = []
-        if not lines is None:
-            for i in lines:
-                rho,theta = i[0]
-                a = np.cos(theta)
-                b = np.sin(theta)
-                x0 = a*rho
-                y0 = b*rho
-
-                x1 = int(x0 + shape[CV_WIDTH]*(-b))
-                y1 = int(y0 + shape[CV_HEIGTH]*(a))
-                x2 = int(x0 - shape[CV_WIDTH]*(-b))
-                y2 = int(y0 - shape[CV_HEIGTH]*(a))
-
-                ret.append(((x1,y1),(x2,y2)))
-        return np.array(ret)
+        if lines is None or len(lines) == 0:
+            return np.empty((0, 2, 2), dtype = np.int64)
+
+        rho, theta = lines[:, 0, 0], lines[:, 0, 1]
+        a = np.cos(theta)
+        b = np.sin(theta)
+        x0 = (a*rho).astype(np.float64)
+        y0 = (b*rho).astype(np.float64)
+        a, b = a.astype(np.float64), b.astype(np.float64)
+
+        ret = np.empty((len(lines), 2, 2), dtype = np.int64)
+        ret[:, GR_FROM, GR_X] = x0 + shape[CV_WIDTH]*(-b)
+        ret[:, GR_FROM, GR_Y] = y0 + shape[CV_HEIGTH]*(a)
+        ret[:, GR_TO, GR_X] = x0 - shape[CV_WIDTH]*(-b)
+        ret[:, GR_TO, GR_Y] = y0 - shape[CV_HEIGTH]*(a)
+        return ret
 
     def unique_lines(a, delta = 10):
-        """Return lines with are far from each other by more than a given distance"""
-        if a is None: return None
+        """Return lines with are far from each other by more than a given distance.
+        Lines are expected to be sorted by rho. Every line starting a new group
+        of close lines is returned"""
+        if a is None or len(a) == 0: return None
+
+        rho = a[:, 0, 0]
+        n, idx = 0, []
+        while n < len(rho):
+            idx.append(n)
+            n = max(np.searchsorted(rho, rho[n] + delta, side = 'left'), n + 1)
+        return a[idx]
+
+    def stage_time(stage, t):
+        """Save stage processing time and return current time"""
+        t2 = perf_counter()
+        res[GR_TIMINGS][stage] = t2 - t
+        logging.info("Stage {} took {:.3f} ms".format(stage, (t2 - t) * 1000))
+        return t2
+
+    def board_from_lines(lines_v, lines_h, t):
+        """Determine board edges, size and spacing from vertical and horizontal lines"""
+        vcross = len(lines_v)
+        hcross = len(lines_h)
+        res[GR_NUM_CROSS_H] = hcross
+        res[GR_NUM_CROSS_W] = vcross
+        t = stage_time('LINES', t)
+
+        # Detect edges
+        if len(lines_h) == 0:
+           logging.error("Cannot find horizontal lines, check params")
+           return None, None
+        if len(lines_v) == 0:
+           logging.error("Cannot find vertical lines, check params")
+           return None, None
+
+        top_left = [int(lines_v[0][0][0]), int(lines_h[0][0][1])]
+        bottom_right = [int(lines_v[-1][0][0])+1, int(lines_h[-1][0][1])+1]
+        edges = [top_left, bottom_right]
+
+        res[GR_EDGES] = edges
+        logging.info("Board edges: {}".format(edges))
+
+        # Draw a lines grid over gray image for debugging
+        if f_debug:
+            line_img = img1_to_img3(gray)
+            line_img = make_lines_img(gray.shape, lines_v, width = 2, color = COLOR_RED, img = line_img)
+            line_img = make_lines_img(gray.shape, lines_h, width = 2, color = COLOR_RED, img = line_img)
+            res[GR_IMG_LINES2] = line_img
+            t = stage_time('DEBUG', t)
+
+        # Determine board size
+        # Check board size is probided in params
+        size = params.get('BOARD_SIZE')
+
+        # Check both sizes are not more or less than 1 point from any of predefined sizes
+        if size is None:
+            for n in DEF_AVAIL_SIZES:
+                if abs(hcross-n) < 2 and abs(vcross-n) < 2:
+                    size = n
+                    break
+
+        # Repeat but now check only one side
+        if size is None:
+            for n in DEF_AVAIL_SIZES:
+                if abs(hcross-n) < 2 or abs(vcross-n) < 2:
+                    size = n
+                    break
+
+        if size is None:
+            # Take size which is more than minimum one (9)
+            size = max(min(hcross, vcross),DEF_AVAIL_SIZES[0])
+            if size > MAX_BOARD_SIZE:
+                # Oops, take a default one
+                logging.error("Cannot properly determine board size, fall back to default")
+                size = DEF_BOARD_SIZE
+
+        res[GR_BOARD_SIZE] = size
+        logging.info("Board size: {}".format(size))
+        if not size in DEF_AVAIL_SIZES:
+            logging.warning("Non-standard board size {}, check parameters".format(size))
 
-        v = accumulate(a, lambda x,y: x if abs(y[0][0] - x[0][0]) < delta else y)
-        l = [i for i in v]
+        # Calculate spacing
+        space_x, space_y = board_spacing(edges, size)
+        if space_x == 0 or space_y == 0:
+           logging.error("Cannot determine spacing, check params")
+           return None, None
 
-        if l is None or len(l) == 0:
-           return None
-        else:
-           return np.unique(np.array(l), axis = 0)
+        spacing = [space_x, space_y]
+        res[GR_SPACING] = spacing
+        logging.info("Detected spacing: {}".format(spacing))
+
+        return edges, size
 
     # Prepare gray image
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    res[GR_TIMINGS] = dict()
+    t = perf_counter()
+    gray = stage_cache.run('GRAY', [img], [],
+        lambda: cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
     res[GR_IMG_GRAY] = gray
+    t = stage_time('GRAY', t)
 
     # Find edges
     n_minval = params['CANNY_MINVAL']
     n_maxval = params['CANNY_MAXVAL']
     n_apsize = params['CANNY_APERTURE']
-    edges = cv2.Canny(gray, n_minval, n_maxval, apertureSize = n_apsize)
+    edges = stage_cache.run('CANNY', [gray], [n_minval, n_maxval, n_apsize],
+        lambda: cv2.Canny(gray, n_minval, n_maxval, apertureSize = n_apsize))
     res[GR_IMG_EDGES] = edges
+    t = stage_time('CANNY', t)
+
+    # Try to detect axis-aligned grid by edges projection profiles
+    # If results are not confident enough, fall back to Hough transformation
+    sizes = [params['BOARD_SIZE']] if params.get('BOARD_SIZE') else DEF_AVAIL_SIZES
+    if params.get('GRID_PROFILE'):
+        grid = stage_cache.run('GRID', [edges], [sizes], lambda: detect_grid(edges, sizes))
+        t = stage_time('GRID', t)
+        if grid is not None and grid['confidence'] >= MIN_GRID_CONFIDENCE:
+            logging.info("Grid detected with confidence {:.2f}".format(grid['confidence']))
+            return board_from_lines(grid_lines(grid['x'], img.shape, True),
+                                    grid_lines(grid['y'], img.shape, False), t)
+        logging.info("Grid detection failed or not confident, using Hough transformation")
+
+    # Estimate grid spacing, phase and board area with autocorrelation of edges profiles
+    # The estimation is used to narrow Hough search to board area and grid lines
+    est = None
+    if params.get('GRID_ESTIMATE'):
+        est = stage_cache.run('GRID_EST', [edges], [sizes], lambda: estimate_grid(edges, sizes))
+        t = stage_time('GRID_EST', t)
+        if est is not None and (est['confidence'] < MIN_PERIOD_STRENGTH or est['size'] is None):
+            logging.info("Grid estimation is not confident, searching lines on whole image")
+            est = None
 
     # Run HoughLinesP, if its parameters are set
     # HoughLinesP detects line segments and may split a single line to multiple segments
@@ -325,11 +635,16 @@ def find_board(img, params, res):
     n_thresh = params['HL_THRESHOLD']
     n_minlen = params['HL_MINLEN']
     if n_thresh > 0 and n_minlen > 0:
-       lines = cv2.HoughLinesP(edges, n_rho, n_theta, n_thresh, minLineLength = n_minlen)
-       lines = houghp_to_lines(lines)
-       img_detect = make_lines_img(edges.shape, lines)
+       def _houghp():
+           lines = cv2.HoughLinesP(edges, n_rho, n_theta, n_thresh, minLineLength = n_minlen)
+           lines = houghp_to_lines(lines)
+           return make_lines_img(edges.shape, lines)
+
+       img_detect = stage_cache.run('HOUGH_P', [edges], [n_rho, n_theta, n_thresh, n_minlen], _houghp)
        res[GR_IMG_LINES] = img_detect
-       img_detect = cv2.bitwise_not(img_detect)
+       img_detect = stage_cache.run('HOUGH_P_NOT', [img_detect], [],
+            lambda: cv2.bitwise_not(img_detect))
+       t = stage_time('HOUGH_P', t)
 
     # Detect lines with HoughLines
     n_rho = params['HL_RHO2']
@@ -337,95 +652,147 @@ def find_board(img, params, res):
     n_thresh = params['HL_THRESHOLD2']
     if n_thresh < 10: n_thresh = 90       #w/a for backward compt
 
+    # If grid was estimated, search only within board area extended by one spacing
+    roi = [0, 0, img_detect.shape[CV_WIDTH], img_detect.shape[CV_HEIGTH]]
+    if est is not None:
+        m = int(max(est['spacing']))
+        roi = [max(est['edges'][0][0] - m, 0), max(est['edges'][0][1] - m, 0),
+               min(est['edges'][1][0] + m + 1, roi[2]), min(est['edges'][1][1] + m + 1, roi[3])]
+        img_detect = stage_cache.run('HOUGH_ROI', [img_detect], roi,
+            lambda: img_detect[roi[1]:roi[3], roi[0]:roi[2]])
+
     # HoughLines doesn't determine coordinates, but only direction (theta) and
     # distance from (0,0) point (rho)
-    lines = cv2.HoughLines(img_detect, n_rho, n_theta, n_thresh)
-    lines = sorted(lines, key = lambda f: f[0][0])
+    # If grid was estimated, it is axis-aligned, so only vertical and horizontal lines are searched
+    if est is None:
+        lines = stage_cache.run('HOUGH_L', [img_detect], [n_rho, n_theta, n_thresh],
+            lambda: cv2.HoughLines(img_detect, n_rho, n_theta, n_thresh))
+    else:
+        def _hough_vh():
+            lines = [cv2.HoughLines(img_detect, n_rho, n_theta, n_thresh,
+                        min_theta = a, max_theta = a + n_theta) for a in (0, np.pi/2)]
+            lines = [x for x in lines if x is not None]
+            return np.concatenate(lines) if len(lines) > 0 else None
+
+        lines = stage_cache.run('HOUGH_VH', [img_detect], [n_rho, n_theta, n_thresh], _hough_vh)
+    t = stage_time('HOUGH_L', t)
+    if lines is None:
+        lines = np.empty((0, 1, 2), dtype = np.float32)
 
     # Find vertical/horizontal lines
-    lines_v = [e for e in lines if e[0][1] == 0.0 if e[0][0] > 1]
+    # Lines found within ROI are moved to image coordinates
+    theta = lines[:, 0, 1]
+    lines_v = lines[theta == 0.0]
+    lines_v[:, 0, 0] += roi[0]
     p = round(np.pi/2 * 100, 0)
-    lines_h = [e for e in lines if round(e[0][1]*100,0) == p if e[0][0] > 1]
+    lines_h = lines[np.round(theta.astype(np.float64) * 100) == p]
+    lines_h[:, 0, 0] += roi[1]
+
+    # Leave only lines matching estimated grid within board area
+    # If a board edge line was not found, take it from the estimation
+    if est is not None:
+        lines_v = grid_filter_lines(lines_v, est, GR_X)
+        lines_h = grid_filter_lines(lines_h, est, GR_Y)
+
+    lines_v = lines_v[lines_v[:, 0, 0] > 1]
+    lines_v = lines_v[np.argsort(lines_v[:, 0, 0], kind = 'stable')]
+    lines_h = lines_h[lines_h[:, 0, 0] > 1]
+    lines_h = lines_h[np.argsort(lines_h[:, 0, 0], kind = 'stable')]
 
     # Remove duplicates (lines too close to each other)
-    unique_v = unique_lines(lines_v)
-    unique_h = unique_lines(lines_h)
+    if est is None:
+        unique_v = unique_lines(lines_v)
+        unique_h = unique_lines(lines_h)
+    else:
+        unique_v = unique_lines(lines_v, max(MIN_LINE_SPACE, est['spacing'][GR_X] / 2))
+        unique_h = unique_lines(lines_h, max(MIN_LINE_SPACE, est['spacing'][GR_Y] / 2))
 
     # Convert from (rho, theta) to coordinate-based lines
     lines_v = hough_to_lines(unique_v, img.shape)
     lines_h = hough_to_lines(unique_h, img.shape)
-    vcross = len(lines_v)
-    hcross = len(lines_h)
-    res[GR_NUM_CROSS_H] = hcross
-    res[GR_NUM_CROSS_W] = vcross
-
-    # Detect edges
-    if len(lines_h) == 0:
-       logging.error("Cannot find horizontal lines, check params")
-       return None, None
-    if len(lines_v) == 0:
-       logging.error("Cannot find vertical lines, check params")
-       return None, None
-
-    top_left = [int(lines_v[0][0][0]), int(lines_h[0][0][1])]
-    bottom_right = [int(lines_v[-1][0][0])+1, int(lines_h[-1][0][1])+1]
-    edges = [top_left, bottom_right]
-
+    return board_from_lines(lines_v, lines_h, t)
+
+# Internal function: find board line position within a narrow band of full resolution image
+def _refine_line(gray, pos, extent, vertical, band, params):
+    """Returns position of a strongest edge within pos +- band pixels,
+    edges are detected only within extent range along the line"""
+    if not vertical:
+        gray = gray.T
+    x0, x1 = max(pos - band, 0), min(pos + band + 1, gray.shape[CV_WIDTH])
+    y0, y1 = max(extent[0], 0), min(extent[1], gray.shape[CV_HEIGTH])
+    if x1 - x0 < 3 or y1 - y0 < 3:
+        return pos
+
+    edges = cv2.Canny(np.ascontiguousarray(gray[y0:y1, x0:x1]),
+        params['CANNY_MINVAL'], params['CANNY_MAXVAL'], apertureSize = params['CANNY_APERTURE'])
+    profile = np.convolve(np.count_nonzero(edges, axis = 0), np.ones(3), mode = 'same')
+    if profile.max() == 0:
+        return pos
+    return x0 + int(np.argmax(profile))
+
+# Internal function: coarse-to-fine board detection
+def _find_board_pyramid(img, params, res, levels, f_debug = True):
+    """Detects board on image downscaled 2^levels times, then refines
+    board edges on full resolution image. Results are in full resolution coordinates,
+    but edges and lines debug images are of downscaled image"""
+
+    f = 2 ** levels
+    t = perf_counter()
+    small = stage_cache.run('PYR_DOWN', [img], [levels],
+        lambda: cv2.resize(img, (img.shape[CV_WIDTH] // f, img.shape[CV_HEIGTH] // f),
+            interpolation = cv2.INTER_AREA))
+    t_down = perf_counter() - t
+
+    # Line detection thresholds are lengths in pixels, so they are scaled too
+    p = {k: params[k] for k in params}
+    p['BOARD_PYRAMID'] = 0
+    if p['HL_THRESHOLD'] > 0 and p['HL_MINLEN'] > 0:
+        p['HL_THRESHOLD'] = max(p['HL_THRESHOLD'] // f, 1)
+        p['HL_MINLEN'] = max(p['HL_MINLEN'] // f, 1)
+    n_thresh = p['HL_THRESHOLD2'] if p['HL_THRESHOLD2'] >= 10 else 90
+    p['HL_THRESHOLD2'] = max(n_thresh // f, 10)
+
+    edges, size = find_board(small, p, res, f_debug)
+    res[GR_TIMINGS]['PYR_DOWN'] = t_down
+    if edges is None:
+        return None, None
+
+    # Map edge lines to centers of corresponding full resolution pixels
+    # and find them within narrow bands. Bottom-right edge is 1 pixel after the line.
+    t = perf_counter()
+    gray = stage_cache.run('GRAY', [img], [],
+        lambda: cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+    (x1, y1), (x2, y2) = [[c * f + f // 2 for c in e] for e in (edges[0], [edges[1][0]-1, edges[1][1]-1])]
+    band = 2 * f
+
+    edges = [[_refine_line(gray, x1, (y1, y2), True, band, params),
+              _refine_line(gray, y1, (x1, x2), False, band, params)],
+             [_refine_line(gray, x2, (y1, y2), True, band, params) + 1,
+              _refine_line(gray, y2, (x1, x2), False, band, params) + 1]]
     res[GR_EDGES] = edges
-    logging.info("Board edges: {}".format(edges))
-
-    # Draw a lines grid over gray image for debugging
-    line_img = img1_to_img3(gray)
-    line_img = make_lines_img(gray.shape, lines_v, width = 2, color = COLOR_RED, img = line_img)
-    line_img = make_lines_img(gray.shape, lines_h, width = 2, color = COLOR_RED, img = line_img)
-    res[GR_IMG_LINES2] = line_img
-
-    # Determine board size
-    # Check board size is probided in params
-    size = params.get('BOARD_SIZE')
-
-    # Check both sizes are not more or less than 1 point from any of predefined sizes
-    if size is None:
-        for n in DEF_AVAIL_SIZES:
-            if abs(hcross-n) < 2 and abs(vcross-n) < 2:
-                size = n
-                break
-
-    # Repeat but now check only one side
-    if size is None:
-        for n in DEF_AVAIL_SIZES:
-            if abs(hcross-n) < 2 or abs(vcross-n) < 2:
-                size = n
-                break
-
-    if size is None:
-        # Take size which is more than minimum one (9)
-        size = max(min(hcross, vcross),DEF_AVAIL_SIZES[0])
-        if size > MAX_BOARD_SIZE:
-            # Oops, take a default one
-            logging.error("Cannot properly determine board size, fall back to default")
-            size = DEF_BOARD_SIZE
-
-    res[GR_BOARD_SIZE] = size
-    logging.info("Board size: {}".format(size))
-    if not size in DEF_AVAIL_SIZES:
-        logging.warning("Non-standard board size {}, check parameters".format(size))
-
-    # Calculate spacing
-    space_x, space_y = board_spacing(edges, size)
-    if space_x == 0 or space_y == 0:
-       logging.error("Cannot determine spacing, check params")
-       return None, None
-
-    spacing = [space_x, space_y]
-    res[GR_SPACING] = spacing
-    logging.info("Detected spacing: {}".format(spacing))
+    res[GR_SPACING] = list(board_spacing(edges, size))
+    logging.info("Refined board edges: {}".format(edges))
 
+    if f_debug:
+        board_debug_images(img, res)
+    res[GR_TIMINGS]['REFINE'] = perf_counter() - t
     return edges, size
 
+# Internal function: make board debug images
+def board_debug_images(img, res):
+    """Make gray and board grid debug images for board defined in results dictionary"""
+    gray = stage_cache.run('GRAY', [img], [],
+        lambda: cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+    res[GR_IMG_GRAY] = gray
+    debug_img = img1_to_img3(gray)
+    space_x, space_y = res[GR_SPACING]
+    draw_board_grid(debug_img, res[GR_EDGES], res[GR_BOARD_SIZE], space_x, space_y, color = COLOR_RED)
+    res[GR_IMG_LINES2] = debug_img
+
 # Define board as provided in parameters
-def get_board_from_params(img, params, res):
-    """Transforms board edges and size provided in params to result and calculate spacing"""
+def get_board_from_params(img, params, res, f_debug = True):
+    """Transforms board edges and size provided in params to result and calculate spacing.
+    If f_debug is False, debug images are not generated (see board_debug_images())"""
 
     # Edges
     if params.get('BOARD_EDGES') is None:
@@ -464,11 +831,8 @@ def get_board_from_params(img, params, res):
     logging.info("Detected spacing: {}".format(spacing))
 
     # Debug images
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    res[GR_IMG_GRAY] = gray
-    debug_img = img1_to_img3(gray)
-    draw_board_grid(debug_img, edges, size, space_x, space_y, color = COLOR_RED)
-    res[GR_IMG_LINES2] = debug_img
+    if f_debug:
+        board_debug_images(img, res)
 
     return edges, size
 
@@ -489,33 +853,36 @@ def convert_xy(coord, res):
     size = res[GR_BOARD_SIZE]
     space_x, space_y = res[GR_SPACING]
 
-    # Loop through converting board coordinates to stone positions
-    # Positions start at 1 and have to be within board's edges
-    stones = []
-    for c in coord:
-        x = int(round(c[0],0))
-        y = int(round(c[1],0))
-        r = int(round(c[2], 0))
-
-        a = int(round((c[0] - edges[0][0]) / space_x, 0)) + 1
-        b = size - int(round((c[1] - edges[0][1]) / space_y, 0))
-
-        if a <= 0 or a > size or b <= 0 or b > size:
-            logging.error("A stone at ({}, {}) is outside the board space".format(a, b))
-        else:
-            stones.extend([[x, y, a, b, r]])
+    coord = np.asarray(coord, dtype = np.float64)
+    if len(coord) == 0:
+        return None
+    coord = coord.reshape(-1, coord.shape[-1])
 
-    if len(stones) == 0:
+    # Convert board coordinates to stone positions
+    # Positions start at 1 and have to be within board's edges
+    s = np.empty((len(coord), 5), dtype = np.int64)
+    s[:, GR_X] = np.round(coord[:, 0])
+    s[:, GR_Y] = np.round(coord[:, 1])
+    s[:, GR_R] = np.round(coord[:, 2])
+    s[:, GR_A] = np.round((coord[:, 0] - edges[0][0]) / space_x) + 1
+    s[:, GR_B] = size - np.round((coord[:, 1] - edges[0][1]) / space_y)
+
+    valid = (s[:, GR_A] > 0) & (s[:, GR_A] <= size) & (s[:, GR_B] > 0) & (s[:, GR_B] <= size)
+    for st in s[~valid]:
+        logging.error("A stone at ({}, {}) is outside the board space".format(st[GR_A], st[GR_B]))
+
+    s = s[valid]
+    if len(s) == 0:
         return None
 
     # Remove duplicates
-    # In case when several stones are at the same place, maximum radius is taken
-    s = np.array(sorted(stones, key = lambda x: [x[2], x[3]]))
-    u, c = np.unique(np.take(s, [2, 3], axis = 1), axis = 0, return_counts = True)
-    g = np.split(s, np.cumsum(c)[:-1])
-    stones_u = np.array([np.max(x, axis = 0) for x in g])
+    # In case when several stones are at the same place, maximum of every property is taken
+    # Stones are accumulated on a board grid, so resulting array is sorted by position
+    n = stones_grid_index(s, size)
+    grid = np.full((size * size, 5), np.iinfo(np.int64).min, dtype = np.int64)
+    np.maximum.at(grid, n, s)
 
-    return stones_u
+    return grid[np.unique(n)]
 
 # Internal function: apply area mask
 def apply_area_mask(img, params):
@@ -531,7 +898,9 @@ def apply_area_mask(img, params):
     m = np.array(m).flatten().tolist()
     logging.info("Area mask is {}".format(m))
 
-    return get_image_area(img, m), [m[0], m[1]]
+    # Clipped area is memoized, so the same image object is returned for the same source image
+    # allowing further processing stages to be memoized too
+    return stage_cache.run('AREA', [img], m, lambda: get_image_area(img, m)), [m[0], m[1]]
 
 # Internal function: move edges to specified offset
 def offset_edges(edges, offset):
@@ -550,29 +919,90 @@ def offset_stones(stones, offset):
         st[GR_Y] += offset[1]
     return stones
 
+# Internal function: scale stones coordinates and radius
+def scale_stones(stones, scale):
+    if stones is None or len(stones) == 0: return stones
+    stones[:, [GR_X, GR_Y, GR_R]] = np.round(stones[:, [GR_X, GR_Y, GR_R]] * scale)
+    return stones
+
+# Resample board area to canonical cell size
+def normalize_cell_size(img, res, cell_size):
+    """Crops board area with a margin of one cell and resamples it
+    so a board grid cell becomes cell_size pixels wide.
+
+    Parameters:
+        img         An image
+        res         Results dictionary with board geometry (see find_board())
+        cell_size   Required cell size in pixels
+
+    Returns:
+        Resampled image,
+        new results dictionary with board geometry in resampled image coordinates,
+        scale factor and offset of the cropped area in source image
+    """
+    edges, spacing = res[GR_EDGES], res[GR_SPACING]
+    scale = cell_size / ((spacing[GR_X] + spacing[GR_Y]) / 2.0)
+
+    x0 = max(int(edges[0][0] - spacing[GR_X]), 0)
+    y0 = max(int(edges[0][1] - spacing[GR_Y]), 0)
+    x1 = min(int(edges[1][0] + spacing[GR_X]) + 1, img.shape[CV_WIDTH])
+    y1 = min(int(edges[1][1] + spacing[GR_Y]) + 1, img.shape[CV_HEIGTH])
+    shape = (max(int(round((x1 - x0) * scale)), 1), max(int(round((y1 - y0) * scale)), 1))
+    logging.info("Board area resampled to {} with scale {:.3f}".format(shape, scale))
+
+    img_st = stage_cache.run('CELL_SIZE', [img], [x0, y0, x1, y1, shape],
+        lambda: cv2.resize(img[y0:y1, x0:x1], shape,
+            interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR))
+
+    res_st = dict()
+    res_st[GR_EDGES] = [[(edges[0][0] - x0) * scale, (edges[0][1] - y0) * scale],
+                        [(edges[1][0] - x0) * scale, (edges[1][1] - y0) * scale]]
+    res_st[GR_SPACING] = [spacing[GR_X] * scale, spacing[GR_Y] * scale]
+    res_st[GR_BOARD_SIZE] = res[GR_BOARD_SIZE]
+    return img_st, res_st, scale, [x0, y0]
+
+
+# Internal function: board grid size enough to hold all given stones
+def stones_grid_size(*stones):
+    return int(max(np.max(s[:, [GR_A, GR_B]]) for s in stones if s is not None and len(s) > 0))
+
+# Internal function: index of stone positions on a board grid
+# Positions are expected to be in 1..size range
+def stones_grid_index(stones, size):
+    return (stones[:, GR_A].astype(np.int64) - 1) * size + (stones[:, GR_B].astype(np.int64) - 1)
 
 # Internal function: duplicate elimination
 def eliminate_duplicates(bs, ws):
-    if ws is None or bs is None:
+    if ws is None or bs is None or len(ws) == 0 or len(bs) == 0:
         return bs, ws
 
     # Priority for white stones
-    for st in ws:
-        px = st[GR_A]
-        py = st[GR_B]
-        for i in range(len(bs)):
-            if px == bs[i,GR_A] and py == bs[i, GR_B]:
-                bs = np.delete(bs, i, axis = 0)
-                break;
-    return bs, ws
+    size = stones_grid_size(bs, ws)
+    occupied = np.zeros(size * size, dtype = np.bool_)
+    occupied[stones_grid_index(ws, size)] = True
+    return bs[~occupied[stones_grid_index(bs, size)]], ws
+
+# Internal function: thread pool for concurrent processing
+_executor = None
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers = 3, thread_name_prefix = 'gr')
+    return _executor
 
 # Board image processing main function
-def process_img(img, params):
+def process_img(img, params, f_parallel = False, f_debug = True):
     """Main image processing function.
 
     Parameters:
-        img    An image to process
-        params Recognition parameters (see grdef.DEF_GR_PARAMS)
+        img         An image to process
+        params      Recognition parameters (see grdef.DEF_GR_PARAMS)
+        f_parallel  If True, black and white stones (and board debug images, if
+                    board edges are set in parameters) are detected concurrently on a thread pool.
+                    Most of processing time is spent in OpenCV functions which release GIL,
+                    so this reduces processing time on multi-core systems
+        f_debug     If False, debug images are neither generated nor returned,
+                    so results contain only stones and board geometry
 
     Returns results dictionary (see grdef.GR_xxx)"""
 
@@ -588,16 +1018,51 @@ def process_img(img, params):
         # Find board edges, spacing, size
         if params.get('BOARD_EDGES') is None:
             # Parameter not set, detecting
-            board_edges, board_size = find_board(img2, params, res)
+            board_edges, board_size = find_board(img2, params, res, f_debug)
             if board_edges is None:
                logging.error('Edges could not be found, processing stopped')
                return None
         else:
-            board_edges, board_size = get_board_from_params(img2, params, res)
+            board_edges, board_size = get_board_from_params(img2, params, res,
+                f_debug = f_debug and not f_parallel)
+
+        # Resample board area to canonical cell size, if requested
+        # Stones are detected on resampled image with its own results dictionary
+        img_st, res_st, scale, area_offset = img2, res, 1.0, [0, 0]
+        if params.get('STONES_CELL_SIZE'):
+            img_st, res_st, scale, area_offset = normalize_cell_size(img2, res,
+                params['STONES_CELL_SIZE'])
 
         # Find stones
-        black_stones = find_stones(img2, params, res, 'B')
-        white_stones = find_stones(img2, params, res, 'W')
+        if params.get('STONES_JOINT'):
+            black_stones, white_stones = find_stones_joint(img_st, params, res_st)
+            if f_debug and f_parallel and params.get('BOARD_EDGES') is not None:
+                board_debug_images(img2, res)
+        elif not f_parallel:
+            black_stones = find_stones(img_st, params, res_st, 'B')
+            white_stones = find_stones(img_st, params, res_st, 'W')
+        else:
+            pool = _get_executor()
+            tasks = [pool.submit(find_stones, img_st, params, res_st, 'B'),
+                     pool.submit(find_stones, img_st, params, res_st, 'W')]
+            if f_debug and params.get('BOARD_EDGES') is not None:
+                tasks.append(pool.submit(board_debug_images, img2, res))
+
+            black_stones = tasks[0].result()
+            white_stones = tasks[1].result()
+            for t in tasks[2:]: t.result()
+
+        # Map stones back from resampled image
+        if res_st is not res:
+            for k in res_st:
+                if k not in (GR_EDGES, GR_SPACING, GR_BOARD_SIZE): res[k] = res_st[k]
+            for st in (black_stones, white_stones):
+                scale_stones(st, 1.0 / scale)
+                offset_stones(st, area_offset)
+
+        # Intermediate images are produced by stages anyway, but are not kept
+        if not f_debug:
+            for k in [k for k in res if k.startswith('IMG_')]: del res[k]
 
         # Elminate duplicates
         if not 'QUALITY_CHECK' in params:
@@ -638,7 +1103,7 @@ def detect_board(img, params):
 
         # Detecting
         res = dict()
-        board_edges, board_size = find_board(img2, params, res)
+        board_edges, board_size = find_board(img2, params, res, f_debug = False)
 
         # Apply offset
         board_edges = offset_edges(board_edges, offset)
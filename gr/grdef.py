@@ -20,6 +20,20 @@ DEF_IMG_COLOR = (80, 145, 210)    # default generated board color
 DEF_BOARD_SIZE = 19               # default board size
 DEF_AVAIL_SIZES = [9, 13, 19]     # available standard board sizes
 MAX_BOARD_SIZE = 21               # maximum board size
+MIN_PYRAMID_SIZE = 320            # minimum size of downscaled image for coarse board detection
+HC_AUTO_MIN_DIST = 0.5            # HoughCircles minimum distance between circles relative to spacing (auto mode)
+HC_AUTO_MIN_RADIUS = 0.15         # HoughCircles minimum radius relative to spacing (auto mode)
+HC_AUTO_MAX_RADIUS = 0.6          # HoughCircles maximum radius relative to spacing (auto mode)
+DT_PEAK_WINDOW = 0.6              # distance transform peak search window relative to spacing (experimental)
+DT_MIN_RADIUS = 0.2               # distance transform minimum stone radius relative to spacing (experimental)
+WS_MAX_RADIUS = 0.6               # maximum stone radius relative to spacing (watershed)
+JOINT_MIN_RADIUS = 0.3            # minimum stone radius relative to spacing (joint detection)
+JOINT_BLUR = 1.0 / 6.0            # blurring kernel size relative to spacing (joint detection)
+JOINT_MIN_FILL = 0.25             # minimum part of a stone covered by its color (joint detection)
+PMF_SPATIAL_RADIUS = 21           # pyramid mean shift filter spatial window radius
+PMF_COLOR_RADIUS = 51             # pyramid mean shift filter color window radius
+PMF_FAST_SCALE = 0.5              # image scale for fast pyramid mean shift filter
+PMF_MIN_SIZE = 128                # minimum size of downscaled image for fast pyramid mean shift filter
 CV_HEIGTH = 0                     # index of height dimension of OpenCv image
 CV_WIDTH = 1                      # index of width dimension of OpenCv image
 CV_CHANNEL = 2                    # index of channel dimension of OpenCv image
@@ -34,6 +48,7 @@ GR_TO = 1                         # index of line end in lines array
 STONE_BLACK = 'B'                 # key for black stones
 STONE_WHITE = 'W'                 # key for white stones
 STONE_COLORS = {STONE_BLACK: "Black", STONE_WHITE: "White"} # stone color names
+DEF_STAGE_CACHE_SIZE = 256 * 1024 * 1024  # maximum size of cached intermediate images (bytes)
 
 # Parameters moved to gr.params
 
@@ -59,4 +74,5 @@ GR_NUM_CROSS_W = "NCROSS_W"         # Number of crosses on vertical line
 GR_IMAGE_SIZE = "IMAGE_SIZE"        # Image size (width, height)
 GR_IMG_WS_B = "IMG_WATERSHED_B"     # Watershed black stones image
 GR_IMG_WS_W = "IMG_WATERSHED_W"     # Watershed white stones image
+GR_TIMINGS = "TIMINGS"              # Processing time of board detection stages (seconds)
 
@@ -0,0 +1,396 @@
+#-------------------------------------------------------------------------------
+# Name:        Go board recognition project
+# Purpose:     Board grid detection using edge projection profiles
+#
+# Author:      kol
+#
+# Created:     18.10.2026
+# Copyright:   (c) kol 2019-2026
+# Licence:     MIT
+#-------------------------------------------------------------------------------
+import numpy as np
+import logging
+
+from .grdef import *
+
+MIN_GRID_SPACE = 5          # minimum distance between grid lines
+PEAK_LEVEL = 0.3            # minimum peak height relative to profile maximum
+SPACING_TOLERANCE = 0.25    # allowed deviation of distance between lines from spacing
+MIN_GRID_CONFIDENCE = 0.6   # minimum grid confidence to accept detection results
+HARMONIC_LEVEL = 0.4        # minimum autocorrelation at half of period to take it as a period
+MAX_MISSED_LINES = 2        # maximum number of adjacent lines missed inside a board
+MIN_PERIOD_STRENGTH = 0.3   # minimum autocorrelation at period to accept grid estimation
+
+def edge_profiles(edges):
+    """Calculate projection profiles of edges image.
+
+    Parameters:
+        edges   Binary edges image (Canny output)
+
+    Returns:
+        Column profile (number of edge pixels in each column) and
+        row profile (number of edge pixels in each row)
+    """
+    mask = (edges > 0).astype(np.float32)
+    return mask.sum(axis = 0), mask.sum(axis = 1)
+
+def profile_peaks(profile, min_dist = MIN_GRID_SPACE):
+    """Find peaks of a projection profile.
+
+    A peak is a local maximum higher than PEAK_LEVEL of profile maximum.
+    Peaks closer than min_dist to a higher peak are suppressed.
+
+    Returns sorted array of peak positions
+    """
+    if len(profile) < 3 or profile.max() <= 0:
+        return np.empty(0, dtype = np.int64)
+
+    # Canny detects both sides of a grid line, so smooth profile to merge them
+    p = np.convolve(profile, np.ones(3) / 3.0, mode = 'same')
+
+    is_max = np.r_[False, (p[1:-1] >= p[:-2]) & (p[1:-1] > p[2:]), False]
+    idx = np.flatnonzero(is_max & (p >= p.max() * PEAK_LEVEL))
+
+    # Non-maximum suppression starting from highest peak
+    keep = []
+    for i in idx[np.argsort(-p[idx], kind = 'stable')]:
+        if all(abs(i - k) >= min_dist for k in keep):
+            keep.append(i)
+
+    return np.sort(np.array(keep, dtype = np.int64))
+
+def profile_period(profile, max_period = None):
+    """Estimate grid spacing as a period of projection profile.
+
+    Period is found as the highest maximum of profile autocorrelation (calculated with FFT).
+    Since autocorrelation also has maximums at multiples of the period,
+    half of found lag is taken while it has a comparable maximum.
+
+    Parameters:
+        profile     Projection profile
+        max_period  Maximum period to check (by default, period of smallest board filling the profile)
+
+    Returns:
+        Spacing (with subpixel accuracy) and strength (normalized autocorrelation value, [0, 1])
+        or None, None if period was not found
+    """
+    n = len(profile)
+    if max_period is None:
+        max_period = n // (DEF_AVAIL_SIZES[0] - 1)
+    max_period = min(int(max_period), n - 2)
+    if max_period <= MIN_GRID_SPACE:
+        return None, None
+
+    p = profile.astype(np.float64) - profile.mean()
+    f = np.fft.rfft(p, 2 * n)
+    ac = np.fft.irfft(f * np.conj(f))[:n]
+    if ac[0] <= 0:
+        return None, None
+    ac /= ac[0]
+
+    lags = np.arange(MIN_GRID_SPACE, max_period)
+    lags = lags[(ac[lags] >= ac[lags-1]) & (ac[lags] > ac[lags+1])]
+    if len(lags) == 0:
+        return None, None
+
+    lag = lags[np.argmax(ac[lags])]
+    while True:
+        half = lags[np.abs(lags - lag / 2.0) <= 1.5]
+        if len(half) == 0:
+            break
+        half = half[np.argmax(ac[half])]
+        if ac[half] < ac[lag] * HARMONIC_LEVEL:
+            break
+        lag = half
+
+    # Parabolic interpolation of maximum position
+    y0, y1, y2 = ac[lag-1], ac[lag], ac[lag+1]
+    d = y0 - 2*y1 + y2
+    spacing = lag + (0.5 * (y0 - y2) / d if d != 0 else 0.0)
+    return spacing, float(y1)
+
+# Internal function: profile values on a comb of lines,
+# a maximum within 1 pixel is taken to tolerate rounding and spacing errors
+def _comb_values(p, pos):
+    idx = np.round(pos).astype(np.int64)[..., None] + np.arange(-1, 2)
+    return p[np.clip(idx, 0, len(p) - 1)].max(axis = -1)
+
+def profile_phase(profile, spacing):
+    """Find grid phase (offset of the first line from profile start) for given spacing.
+
+    Every integer offset is checked, offset of a comb of lines with
+    maximum sum of profile values is returned
+    """
+    p = np.convolve(profile, np.ones(3) / 3.0, mode = 'same')
+    offsets = np.arange(int(np.ceil(spacing)))
+    pos = offsets[:, None] + np.arange(0, len(p) - offsets[-1], spacing)[None, :]
+    return int(offsets[np.argmax(_comb_values(p, pos).sum(axis = 1))])
+
+def estimate_grid_axis(profile, sizes = DEF_AVAIL_SIZES):
+    """Estimate grid spacing, phase, first and last lines on one axis.
+
+    Lines of a comb with estimated spacing and phase are considered to belong
+    to the board if they match a profile peak. Board area is a longest chain
+    of such lines (up to MAX_MISSED_LINES adjacent lines could be missed).
+    Number of lines is snapped to a board size if it differs by 1.
+
+    Returns:
+        A tuple (spacing, phase, first, last, count, strength) or None
+    """
+    spacing, strength = profile_period(profile)
+    if spacing is None:
+        return None
+    phase = profile_phase(profile, spacing)
+
+    p = np.convolve(profile, np.ones(3) / 3.0, mode = 'same')
+    pos = np.arange(phase, len(profile), spacing)
+    v = _comb_values(p, pos)
+    found = np.flatnonzero(v >= np.percentile(v, 90) * PEAK_LEVEL)
+    if len(found) < 2:
+        return None
+
+    # Longest chain of lines
+    breaks = np.flatnonzero(np.diff(found) > MAX_MISSED_LINES + 1)
+    starts = np.r_[0, breaks + 1]
+    ends = np.r_[breaks, len(found) - 1]
+    best = np.argmax(found[ends] - found[starts])
+    first, last = found[starts[best]], found[ends[best]]
+    count = last - first + 1
+
+    n = [n for n in sizes if abs(count - n) == 1]
+    if len(n) > 0:
+        # Add a line on the strongest side or remove a line on the weakest one
+        v_first = v[first-1] if first > 0 else -1
+        v_last = v[last+1] if last + 1 < len(pos) else -1
+        if count < n[0] and max(v_first, v_last) >= 0:
+            if v_first >= v_last:
+                first -= 1
+            else:
+                last += 1
+            count += 1
+        elif count > n[0]:
+            if v[first] < v[last]:
+                first += 1
+            else:
+                last -= 1
+            count -= 1
+
+    # Snap board edges to profile maximums
+    def snap(x):
+        r = int(spacing * SPACING_TOLERANCE)
+        x0 = max(int(round(x)) - r, 0)
+        return x0 + int(np.argmax(p[x0:int(round(x)) + r + 1]))
+
+    return spacing, phase, snap(pos[first]), snap(pos[last]), count, strength
+
+def estimate_grid(edges, sizes = DEF_AVAIL_SIZES):
+    """Estimate board grid using autocorrelation of edges projection profiles.
+
+    This is a cheap estimation which can be used to narrow search of
+    board lines (see gr.find_board()).
+
+    Parameters:
+        edges       Binary edges image (Canny output)
+        sizes       List of board sizes to snap number of lines to
+
+    Returns:
+        None if grid was not found or a dictionary with the following keys:
+            spacing     Spacing on x and y axis
+            phase       Offset of the first grid line on x and y
+            edges       Board edges [[x1,y1], [x2,y2]]
+            size        Board size or None if numbers of lines on axes differ
+                        or are not a board size (e.g. only a part of board is visible)
+            confidence  Period strength in [0, 1] range
+    """
+    col_profile, row_profile = edge_profiles(edges)
+    ax = estimate_grid_axis(col_profile, sizes)
+    ay = estimate_grid_axis(row_profile, sizes)
+    if ax is None or ay is None:
+        logging.info("Cannot estimate grid period")
+        return None
+
+    est = {
+        'spacing': [ax[0], ay[0]],
+        'phase': [ax[1], ay[1]],
+        'edges': [[ax[2], ay[2]], [ax[3], ay[3]]],
+        'size': ax[4] if ax[4] == ay[4] and ax[4] in sizes else None,
+        'confidence': min(ax[5], ay[5])
+    }
+    logging.info("Estimated grid: spacing {:.1f}, {:.1f}, edges {}, size {}, confidence {:.2f}".format(
+        est['spacing'][0], est['spacing'][1], est['edges'], est['size'], est['confidence']))
+    return est
+
+def fit_grid_lines(peaks, heights, spacing, sizes, length):
+    """Fit a grid of equally spaced lines to profile peaks.
+
+    Every combination of board size, grid line matching a peak and grid position
+    is checked, grid matching peaks of largest total height is selected.
+    Then grid origin and spacing are refined by least squares fit of matched peaks.
+    Grid lines do not need to have a peak, so lines hidden by stones are allowed.
+
+    Parameters:
+        peaks       Sorted array of peak positions
+        heights     Array of peak heights
+        spacing     Estimated grid spacing
+        sizes       List of board sizes to check
+        length      Profile length
+
+    Returns:
+        Array of grid line positions or None
+    """
+    if spacing is None or spacing < MIN_GRID_SPACE or len(peaks) < 2:
+        return None
+
+    best = None
+    for n in sizes:
+        step = spacing
+        if (n - 1) * step >= length:
+            continue
+
+        # Grid origins (position of first line) assuming line j passes through a peak
+        origins = (peaks[:, None] - np.arange(n)[None, :] * step).ravel()
+        origins = origins[(origins >= -step * SPACING_TOLERANCE) &
+                          (origins + (n - 1) * step < length + step * SPACING_TOLERANCE)]
+        if len(origins) == 0:
+            continue
+
+        # Line index nearest to every peak for every origin
+        d = (peaks[None, :] - origins[:, None]) / step
+        k = np.round(d)
+        match = (k >= 0) & (k < n) & (np.abs(d - k) <= SPACING_TOLERANCE)
+        score = np.where(match, heights[None, :], 0).sum(axis = 1)
+
+        i = int(np.argmax(score))
+        if best is None or score[i] > best[0]:
+            best = (score[i], n, k[i][match[i]], peaks[match[i]])
+
+    if best is None:
+        return None
+
+    score, n, k, pos = best
+    if len(np.unique(k)) < 2:
+        return None
+
+    # Refine origin and spacing
+    spacing, origin = np.polyfit(k, pos, 1)
+    return origin + np.arange(n) * spacing
+
+def shift_grid_lines(profile, pos):
+    """Check grid lines shifted by one spacing in both directions.
+
+    A strong edge next to the board (board frame, coordinate labels) could attract
+    a grid fitted to profile peaks, while outer grid lines are weak. Profile values
+    at all lines of every shifted grid are compared, and the best grid is returned.
+
+    Parameters:
+        profile     Projection profile
+        pos         Array of grid line positions
+
+    Returns:
+        Array of grid line positions
+    """
+    p = np.convolve(profile, np.ones(3) / 3.0, mode = 'same')
+    step = (pos[-1] - pos[0]) / (len(pos) - 1)
+    shifts = [0.0] + [s for s in (-step, step) if pos[0] + s >= 0 and pos[-1] + s <= len(p) - 1]
+    sums = [_comb_values(p, pos + s).sum() for s in shifts]
+    return pos + shifts[int(np.argmax(sums))]
+
+def grid_contrast(profile, pos):
+    """Estimate how well grid lines stand out of a projection profile.
+
+    Profile values at grid lines are compared to values at the middle between lines,
+    which are high when the grid was fitted to noise (wood texture, stones).
+
+    Returns:
+        Contrast value, 1 for ideal grid, 0 or less for a random one
+    """
+    p = np.convolve(profile, np.ones(3) / 3.0, mode = 'same')
+    mid = (pos[1:] + pos[:-1]) / 2.0
+    on = p[np.clip(np.round(pos).astype(np.int64), 0, len(p)-1)].mean()
+    off = p[np.clip(np.round(mid).astype(np.int64), 0, len(p)-1)].mean()
+    return 1.0 - off / on if on > 0 else 0.0
+
+def grid_filter_lines(lines, est, axis):
+    """Filter Hough lines using grid estimation (see estimate_grid()).
+
+    Lines which are not close to estimated grid lines or outside of board area are removed.
+    If there is no line close to a board edge, it is added.
+
+    Parameters:
+        lines       Array of lines in HoughLines format (rho, theta) of one direction
+        est         Grid estimation
+        axis        GR_X for vertical lines, GR_Y for horizontal ones
+
+    Returns:
+        Array of lines
+    """
+    spacing, phase = est['spacing'][axis], est['phase'][axis]
+    first, last = est['edges'][0][axis], est['edges'][1][axis]
+    tol = spacing * SPACING_TOLERANCE
+
+    rho = lines[:, 0, 0].astype(np.float64)
+    d = (rho - phase) / spacing
+    lines = lines[(np.abs(d - np.round(d)) <= tol / spacing) & (rho >= first - tol) & (rho <= last + tol)]
+
+    theta = 0.0 if axis == GR_X else np.pi / 2
+    missed = [[[e, theta]] for e in (first, last) if not np.any(np.abs(lines[:, 0, 0] - e) <= tol)]
+    if len(missed) > 0:
+        lines = np.concatenate([lines, np.array(missed, dtype = lines.dtype)])
+    return lines
+
+def detect_grid(edges, sizes = DEF_AVAIL_SIZES):
+    """Detect axis-aligned board grid on edges image using projection profiles.
+
+    Parameters:
+        edges       Binary edges image (Canny output)
+        sizes       List of board sizes to check
+
+    Returns:
+        None if grid was not found or a dictionary with the following keys:
+            x       Positions of vertical lines
+            y       Positions of horizontal lines
+            confidence  Confidence of detection in [0, 1] range, 0 if numbers
+                        of lines on axes differ
+    """
+    col_profile, row_profile = edge_profiles(edges)
+    grid = dict()
+    confidence = 1.0
+
+    for axis, profile in [('x', col_profile), ('y', row_profile)]:
+        peaks = profile_peaks(profile)
+        spacing, _ = profile_period(profile)
+        pos = fit_grid_lines(peaks, profile[peaks], spacing, sizes, len(profile))
+        if pos is None:
+            logging.info("Grid lines not found on {} axis".format(axis))
+            return None
+        pos = shift_grid_lines(profile, pos)
+
+        contrast = grid_contrast(profile, pos)
+        logging.info("Grid on {} axis: {} lines from {:.1f} to {:.1f}, contrast {:.2f}".format(
+            axis, len(pos), pos[0], pos[-1], contrast))
+
+        grid[axis] = np.round(pos).astype(np.int64)
+        confidence = min(confidence, contrast)
+
+    # Axes are fitted independently, but a board has the same number of lines on both
+    if len(grid['x']) != len(grid['y']) or len(grid['x']) not in sizes:
+        logging.info("Grid lines numbers {} and {} do not make a board".format(len(grid['x']), len(grid['y'])))
+        confidence = 0.0
+
+    grid['confidence'] = confidence
+    return grid
+
+def grid_lines(pos, shape, vertical):
+    """Convert grid line positions to lines array ((x1,y1),(x2,y2)) spanning the image"""
+    ret = np.empty((len(pos), 2, 2), dtype = np.int64)
+    if vertical:
+        ret[:, GR_FROM, GR_X] = pos
+        ret[:, GR_FROM, GR_Y] = shape[CV_HEIGTH]
+        ret[:, GR_TO, GR_X] = pos
+        ret[:, GR_TO, GR_Y] = -shape[CV_HEIGTH]
+    else:
+        ret[:, GR_FROM, GR_X] = -shape[CV_WIDTH]
+        ret[:, GR_FROM, GR_Y] = pos
+        ret[:, GR_TO, GR_X] = shape[CV_WIDTH]
+        ret[:, GR_TO, GR_Y] = pos
+    return ret
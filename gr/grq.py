@@ -11,21 +11,37 @@
 from .board import GrBoard
 from .log import GrLogger
 from .grdef import *
-from .params import GrParam, GrParams
-from .utils import show_stones, random_colors
+from .params import GrParam
+from .history import GrOptHistory
 
+import os
 import cv2
 import numpy as np
-from itertools import combinations
+from threading import Lock, Event
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import logging
 
 import warnings
 with warnings.catch_warnings():
     warnings.filterwarnings("ignore", category=FutureWarning)
 
-    from skopt.space.space import Real, Integer
-    from skopt import gp_minimize, gbrt_minimize, forest_minimize
-    from skopt.utils import use_named_args
+    from skopt.space.space import Integer
+    from skopt import Optimizer
+
+OPT_INITIAL_POINTS = 10     # number of random points evaluated before surrogate model is used
+OPT_JOINT_PART = 0.2        # part of passes used for joint refinement in separable optimization
+OPT_JOINT_RANGE = 0.1       # half size of joint refinement space relative to parameter range
+OPT_FIDELITY_SCALES = [0.5]  # image scales for multi-fidelity optimization
+OPT_HALVING_RATE = 3        # part of candidates promoted to next scale is 1 / rate
+
+# Parameters measured in pixels, which should be rescaled for a resized image
+# HoughLinesP threshold and minimum length are numbers of line pixels, so they are rescaled too.
+# HoughLines threshold (HL_THRESHOLD2) is rescaled separately, see scale_params()
+OPT_PIXEL_PARAMS = ['HC_MASK_B', 'HC_MASK_W', 'BLUR_MASK_B', 'BLUR_MASK_W',
+                    'HC_MINDIST', 'HC_MAXRADIUS', 'HC_AUTO_MINDIST', 'HC_AUTO_MAXRADIUS',
+                    'HL_THRESHOLD', 'HL_MINLEN']
+OPT_PIXEL_AREAS = ['AREA_MASK', 'BOARD_EDGES']
 
 
 # Recognition quality metrics
@@ -55,10 +71,17 @@ with warnings.catch_warnings():
 #   Expected counts     Expected number of stones found
 
 # Base class
+# If a metric could be checked for stones of one color, it has per_color set
+# and checks only stones of color bw given to constructor (None means both colors)
 class QualityMetric(object):
-    def __init__(self, master):
+    per_color = False
+
+    def __init__(self, master, bw = None):
         self.master = master
-        self.log = GrLogger(master)
+        self.bw = bw
+        # Metrics are created on every check, so they share master log
+        # instead of adding new log handlers each time
+        self.log = master.log
 
     def check(self, board):
         """Quality check function.
@@ -69,6 +92,12 @@ class QualityMetric(object):
     def name(self):
         return str(type(self)).split('.')[2].split("'")[0]
 
+    def color_stones(self, board):
+        """Stones of colors being checked as a list of (color, stones) tuples"""
+        colors = [STONE_BLACK, STONE_WHITE] if self.bw is None else [self.bw]
+        return [(bw, board.black_stones if bw == STONE_BLACK else board.white_stones) \
+            for bw in colors]
+
 
 #
 # Metric classes
@@ -89,7 +118,16 @@ class BoardSizeMetric(QualityMetric):
 
 class NumberOfStonesMetric(QualityMetric):
     """Any stone, too many stones, same number of stones checks"""
+    per_color = True
+
     def check(self, board):
+        if self.bw is not None:
+            # Same number check requires both colors
+            stones = self.color_stones(board)[0][1]
+            c = len(stones) if stones is not None else 0
+            self.master.log.debug("Number of stones: {} {}".format(c, STONE_COLORS[self.bw]))
+            return 1.0 if c == 0 or c > 100 else 0.0
+
         cb = len(board.black_stones) if board.black_stones is not None else 0
         cw = len(board.white_stones) if board.white_stones is not None else 0
         self.master.log.debug("Number of stones: {} black, {} white".format(cb, cw))
@@ -107,6 +145,8 @@ class NumberOfStonesMetric(QualityMetric):
 
 class ProperPositionMetric(QualityMetric):
     """Proper stone position check"""
+    per_color = True
+
     def check(self, board):
         def f(stones):
             # Collect all stones and check all are inside board's space
@@ -118,6 +158,8 @@ class ProperPositionMetric(QualityMetric):
 
             return 1.0 if len(s) == 0 or max(s) > board.board_size or min(s) <= 0 else 0.0
 
+        if self.bw is not None:
+            return f(self.color_stones(board)[0][1])
         return f(board.black_stones) and f(board.white_stones)
 
 class NoDuplicatesMetric(QualityMetric):
@@ -144,20 +186,21 @@ class NoDuplicatesMetric(QualityMetric):
 
 class NormalRadiusMetric(QualityMetric):
     """Radius is about the same"""
+    per_color = True
+
     def check(self, board):
         # Merge black and white positions
         r = []
-        if board.black_stones is not None:
-            r = [ x[GR_R] for x in board.black_stones]
-        if board.white_stones is not None:
-            r.extend ([ x[GR_R] for x in board.white_stones])
+        for _, stones in self.color_stones(board):
+            if stones is not None:
+                r.extend([ x[GR_R] for x in stones])
         if len(r) == 0:
             return 1.0
 
         # Stone radius is not very small
         m = np.mean(r)
         self.master.log.debug("Stone radius mean: {}".format(m))
-        if m <= 5:
+        if m <= 5 * self.master.scale:
             return 1.0
 
         # Check for outliers
@@ -178,6 +221,7 @@ class NormalRadiusMetric(QualityMetric):
 
 class NoOverlapsMetric(QualityMetric):
     """Stones are not overlapping"""
+    per_color = True
 
     def check(self, board):
         def circle_square(R, r):
@@ -190,7 +234,7 @@ class NoOverlapsMetric(QualityMetric):
             The circles have radii R and r, and their centres are separated by d.
             Source: https://scipython.com/book/chapter-8-scipy/problems/p84/overlapping-circles/
             """
-            d, R, r = np.float(d), np.float(R), np.float(r)
+            d, R, r = float(d), float(R), float(r)
             if d <= abs(R-r):
                 # One circle is entirely enclosed in the other
                 return circle_square(R, r)
@@ -205,26 +249,24 @@ class NoOverlapsMetric(QualityMetric):
                      0.5 * (r2 * np.sin(2*alpha) + R2 * np.sin(2*beta))
                      )
 
-        def find_d(p1, p2):
-            """Determine distance among two points"""
-            x = np.int32(p1[0]) - np.int32(p2[0])
-            y = np.int32(p1[1]) - np.int32(p2[1])
-            return np.sqrt(x**2 + y**2)
-
         # Merge black and white positions
         stones = []
-        if board.black_stones is not None:
-            stones = [ (x[GR_X], x[GR_Y], x[GR_R]) for x in board.black_stones]
-        if board.white_stones is not None:
-            stones.extend ([ (x[GR_X], x[GR_Y], x[GR_R]) for x in board.white_stones])
+        for _, bw_stones in self.color_stones(board):
+            if bw_stones is not None:
+                stones.extend([ (x[GR_X], x[GR_Y], x[GR_R]) for x in bw_stones])
         if len(stones) == 0:
             return 1.0
 
-        # Make a list of possible combinations and walk through
-        pairs = combinations(stones, 2)
+        # Distances among all combinations of stones are calculated at once,
+        # then only pairs of circles which could overlap are walked through
+        s = np.array(stones, dtype = np.int32)
+        i, j = np.triu_indices(len(s), 1)
+        dist = np.sqrt((s[i, 0] - s[j, 0])**2 + (s[i, 1] - s[j, 1])**2)
+        near = dist < s[i, 2] + s[j, 2]
+
         dups = []
-        for v in pairs:
-            d = find_d(v[0][:2], v[1][:2])
+        for d, v in zip(dist[near], zip(i[near], j[near])):
+            v = (stones[v[0]], stones[v[1]])
             a = intersection_area(d, v[0][2], v[1][2])
             if a > 0 and a > circle_square(v[0][2], v[1][2]) * 0.05:
                 # Stones are considered overlapping with more than 5% intersection
@@ -250,12 +292,15 @@ class WatershedOkMetric(QualityMetric):
 
 class WipedOutMetric(QualityMetric):
     """Morphed image contains no objects"""
+    per_color = True
+
     def check(self, board):
         def f(bw):
             # Get the image
             if board.results is None:
                 return 1.0
 
+            # Morphed image is a debug image, so it should be kept with results
             img = board.results.get("IMG_MORPH_" + bw)
             if img is None or min(img.shape[:2]) == 0:
                 return 1.0
@@ -274,7 +319,7 @@ class WipedOutMetric(QualityMetric):
 
             return 1.0 if nb > nc * 0.50 or nw > nc * 0.95 else 0.0
 
-        return 0.0 if f('B') + f('W') == 0.0 else 1.0
+        return 0.0 if sum([f(bw) for bw, _ in self.color_stones(board)]) == 0.0 else 1.0
 
 class ExpectedStonesMetric(QualityMetric):
     """Expecting stones at specified positions"""
@@ -299,7 +344,16 @@ class ExpectedStonesMetric(QualityMetric):
 class BoardOptimizer(object):
     """Quality checking and optimization master class"""
 
-    def __init__(self, board = None, debug = False, echo = False):
+    def __init__(self, board = None, debug = False, echo = False, history = None):
+        """Constructor
+
+        Parameters:
+            board       Board to optimize
+            debug       If True, debug output is logged
+            echo        If True, log is also printed to stderr
+            history     Optimization history (see history.GrOptHistory) or its file name.
+                        If None, history is kept in memory for a single run only
+        """
         self.log = GrLogger(name = 'qc',
             level = logging.DEBUG if debug else logging.INFO,
             echo = echo)
@@ -324,11 +378,22 @@ class BoardOptimizer(object):
         self.q_opt = None
         self.res = None
         self.success = False
+        self.stop_reason = None
+        self.history = history
+        self.scale = 1.0    # scale of board image relative to original one (see scale_params())
+
+    def color_metrics(self, bw = None):
+        """Metrics applicable to stones of given color. If bw is None, all metrics are returned"""
+        if bw is None:
+            return self.metrics
+        return [mc for mc in self.metrics if mc[0].per_color and bw in mc[2]]
 
-    def quality(self, board = None):
+    def quality(self, board = None, bw = None):
         """Board recognition quality check function.
         Returns a quality of board image recogition with current parameters.
         A auality is a floating point between 0 (best) and 1 (worst)
+        If bw is set, only stones of that color are checked with metrics applicable
+        to single color (see color_metrics())
         """
 
         # Load board
@@ -362,13 +427,13 @@ class BoardOptimizer(object):
                 {"Errors ": self.board_log.errors, "Last error": self.board_log.last_error}
 
         # Check every metric
-        for mc in self.metrics:
-            m = mc[0](self)
+        for mc in self.color_metrics(bw):
+            m = mc[0](self, bw)
             r[m.name]  = [m.check(self.board), mc[1]]
             self.log.debug("{} check returns {}".format(m.name, r[m.name][0]))
 
         # Check for local extremums
-        self.check_empty_board(r)
+        self.check_empty_board(r, bw)
 
         # Summarize
         x = [x[0] for x in r.values()]
@@ -393,7 +458,7 @@ class BoardOptimizer(object):
                     space.extend([Integer(min_v, max_v, name = p.key)])
         return space
 
-    def check_empty_board(self, r):
+    def check_empty_board(self, r, bw = None):
         """Internal - empty board extremum check"""
 
         # If a few stones detected on board due to invalid settings, other
@@ -404,6 +469,9 @@ class BoardOptimizer(object):
         # an advantage
         cb = len(self.board.black_stones) if self.board.black_stones is not None else 0
         cw = len(self.board.white_stones) if self.board.white_stones is not None else 0
+        if bw is not None:
+            # Only stones of one color are checked
+            cb = cw = cb if bw == STONE_BLACK else cw
 
         if cb < 5 or cw < 5:
             self.log.info("Avoiding 'empty board' local extremum")
@@ -411,25 +479,69 @@ class BoardOptimizer(object):
             for k in ['NumberOfStonesMetric', 'ProperPositionMetric',
                       'NoDuplicatesMetric', 'NormalRadiusMetric',
                       'NoOverlapsMetric', 'WatershedOkMetric']:
+                if k not in r:
+                    continue
                 if r[k][0] == 0.0:
                     r[k][0] += 0.03
                 elif r[k][0] < 0.9:
                     r[k][0] += 0.01
 
 
-    def optimize(self, groups = None, max_pass = 100, callback = None):
+    def optimize(self, groups = None, max_pass = 100, callback = None, jobs = 1,
+        separable = False, fidelity = None, time_limit = None, patience = None, target = None):
         """Optimize board recogiton parameters.
         A function runs max_pass iterations of forest regression trying
         to find parameters combination which gives the best quality of
-        recognition."""
+        recognition.
+
+        By default (jobs = 1) passes are evaluated one by one on the board itself.
+        If jobs is greater than 1, parameter combinations are evaluated in batches
+        of jobs passes, each pass of a batch runs in a separate worker process holding
+        its own copy of board image and parameters. If jobs is None or 0,
+        number of CPUs is used.
+
+        If separable is True, black and white stones parameters are optimized
+        separately, each against metrics of stones of that color only (see color_metrics()).
+        With worker processes both colors are optimized at the same time.
+        Then OPT_JOINT_PART of passes is used to refine all parameters together
+        near the best combination found for each color, so metrics checking both colors
+        are taken into account.
+
+        If fidelity is set to a list of image scales (e.g. OPT_FIDELITY_SCALES),
+        multi-fidelity optimization is performed with successive halving.
+        Candidate combinations are evaluated on the board image downscaled to
+        the first scale, best 1 / OPT_HALVING_RATE of them are promoted to the next scale
+        and so on, and only the rest are evaluated on full image and reported
+        to the optimizer. Parameters measured in pixels are rescaled to the image
+        (see scale_params()). In this mode max_pass is a number of candidates.
+
+        Optimization stops before max_pass passes if time_limit seconds passed
+        since the start, if the best quality was not improved in last patience passes
+        or if target quality is reached (e.g. 0 for perfect recognition).
+        Patience and target apply to every stage of separable optimization.
+        Patience is counted after OPT_INITIAL_POINTS random passes, since
+        no improvement is expected from them. If initial parameters already
+        give target quality, no passes are made.
+        Reason of the stop is logged and saved to stop_reason attribute
+        (None if all passes were made).
+
+        Parameters found are applied to the board only if their quality is better
+        than initial quality, so a stopped optimization does not make recognition worse.
+
+        If optimization history is set, all evaluated combinations are saved to it.
+        If the history contains results of previous runs for the same image,
+        optimization space and other parameters, the run starts with them,
+        and combinations found there are not evaluated again."""
 
         # Initialize
         self.log.info("Running parameters optimization for {}".format(self.board.image_file))
         self.log.start()
+        t_start = perf_counter()
+        self.stop_reason = None
 
-        # Pyramid filters has to be turned off as they are extra heavy
-        self.board.params['PYRAMID_B'] = 0
-        self.board.params['PYRAMID_W'] = 0
+        # Full pyramid filters are extra heavy, so fast mode is used instead
+        for k in ['PYRAMID_B', 'PYRAMID_W']:
+            if self.board.params[k] == 1: self.board.params[k] = 2
 
         p_init = self.board.params.todict()
         self.log.debug("Initial parameters:")
@@ -441,37 +553,52 @@ class BoardOptimizer(object):
         self.log.info("Initial quality: {}".format(self.q_init[0]))
         self.npass = 0
 
+        # Nothing to optimize if initial parameters already give target quality
+        if target is not None and self.q_init[0] <= target:
+            self.stop_reason = "target quality {} reached".format(target)
+            self.q_opt = self.q_init
+            self.success = False
+            self.log.info("Optimization stopped before first pass: {}".format(self.stop_reason))
+            self.log.info("Optimization run took {} seconds".format(self.log.stop()))
+            return self.success
+
         g = groups if groups is not None else self.board.params.groups
         space = self.opt_space(groups = g)
-
-        # Enclosed objective function
-        @use_named_args(space)
-        def objective(**params):
-            # Estimate qualist
-            self.npass += 1
-            self.log.info("== Pass #{}".format(self.npass))
-            self.board_log.info("== Pass #{}".format(self.npass))
-            self.board.params = params
-            q, p = self.quality()
-
-            # If board params are not been optimized, save board size and edges
-            # to prevent them from detection next time
-            if self.board.results is not None and 'LUM_EQ' not in params.keys() \
-                and self.board.param_board_edges is None:
-                self.board.param_board_size = self.board.board_size
-                self.board.param_board_edges = self.board.board_edges
-                self.log.debug("Saving calculated board size {} and edges {}".format(
-                    self.board.param_board_size, self.board.param_board_edges))
-
-            # Logging
-            self.log.info("Pass #{} quality: {}".format(self.npass, q))
+        names = [d.name for d in space]
+
+        # If board params are not been optimized, save board size and edges
+        # to prevent them from detection on every pass
+        if self.board.results is not None and 'LUM_EQ' not in names \
+            and self.board.param_board_edges is None:
+            self.board.param_board_size = self.board.board_size
+            self.board.param_board_edges = self.board.board_edges
+            self.log.debug("Saving calculated board size {} and edges {}".format(
+                self.board.param_board_size, self.board.param_board_edges))
+
+        # Every pass sets all optimized parameters, ones not in space of current run
+        # are kept at their initial values
+        p_start = self.board.params.todict()
+        p_base = {k: p_start[k] for k in names}
+
+        # Enclosed pass results logging function
+        def log_pass(n, params, q, p):
+            self.log.info("Pass #{} quality: {}".format(n, q))
             self.log.debug("Metrics:")
             for k in p:
                 self.log.debug("\t{}: {}".format(k, p[k]))
             self.log.debug("Parameters:")
             for k in params:
                 self.log.debug("\t{}: {}".format(k, params[k]))
-            return q
+
+        # Optimization history
+        history = self.history
+        if not isinstance(history, GrOptHistory):
+            history = GrOptHistory(history)
+
+        # Colors could be optimized concurrently, so passes counting, logging,
+        # history and callback are guarded with a lock
+        lock = Lock()
+        stop = Event()
 
         # Enclosed callback function
         def callback_fun(res):
@@ -482,22 +609,238 @@ class BoardOptimizer(object):
                                 "npass": self.npass,
                                 "max_pass": max_pass})
 
-        x0, y0 = None, None
-        if self.res is not None:
-            self.log.info("Reusing last optimization results as starting points")
-            x0 = self.res.x_iters
-            y0 = list(self.res.func_vals)
-
-        self.res = forest_minimize(objective,
-            space,
-            n_calls = max_pass,
-            n_jobs = -1,
-            x0 = x0,
-            y0 = y0,
-            callback = callback_fun)
-
-        for n, v in enumerate(self.res.x):
-            self.board.params[space[n].name] = v
+        # Enclosed function to check stop conditions, returns a reason to stop or None
+        # Time limit stops the whole optimization, other conditions stop optimization
+        # of current space only
+        def stop_check(best, n_stale):
+            if time_limit is not None and perf_counter() - t_start >= time_limit:
+                stop.set()
+                return "time limit of {} seconds reached".format(time_limit)
+            if target is not None and best is not None and best <= target:
+                return "target quality {} reached".format(target)
+            if patience is not None and n_stale >= patience:
+                return "no improvement in {} passes".format(patience)
+            return None
+
+        # Enclosed function to optimize parameters of given space
+        # If bw is set, quality of stones of that color is estimated only
+        # Starting point x_start is evaluated before optimization if it is not in history
+        def run_space(space, max_pass, n_batch, bw = None, x0 = None, y0 = None, x_start = None):
+            names = [d.name for d in space]
+            p_fixed = {k: v for k, v in p_start.items() if k not in names}
+            key = GrOptHistory.make_key(self.board.image, space, p_fixed, self.color_metrics(bw))
+
+            # Enclosed function to assign numbers to new passes
+            def new_passes(n):
+                with lock:
+                    self.npass += n
+                    return list(range(self.npass - n + 1, self.npass + 1))
+
+            # Enclosed objective function
+            # Only full scale results are saved to history
+            def objective(xs, passes, scale = 1.0):
+                def pass_params(x):
+                    p = dict(p_base, **dict(zip(names, x)))
+                    return p if scale == 1.0 else scale_params(dict(p_start, **p), scale)
+
+                # Estimate quality in worker processes for points not found in history
+                with lock:
+                    found = [history.find(key, x) if scale == 1.0 else None for x in xs]
+                if pool is not None:
+                    batch = [pass_params(x) for x, h in zip(xs, found) if h is None]
+                    n = len(batch)
+                    results = iter(list(pool.map(_quality_worker, batch, [bw] * n, [scale] * n)))
+
+                ret = []
+                with lock:
+                    for n, x, h in zip(passes, xs, found):
+                        params = dict(zip(names, x))
+                        if scale == 1.0:
+                            self.log.info("== Pass #{}{}".format(n,
+                                "" if bw is None else " ({} stones)".format(STONE_COLORS[bw])))
+
+                        if h is not None:
+                            self.log.info("Pass #{} found in history".format(n))
+                            q, p = h["q"], h["metrics"]
+                        else:
+                            if pool is None:
+                                # Estimate quality on the board
+                                qc = self if scale == 1.0 else fidelity_qc[scale]
+                                qc.board_log.info("== Pass #{}".format(n))
+                                t = perf_counter()
+                                qc.board.params = pass_params(x)
+                                (q, p), t = qc.quality(bw = bw), perf_counter() - t
+                            else:
+                                (q, p), t = next(results)
+                            if scale == 1.0:
+                                history.add(key, space, x, q, p, t)
+
+                        if scale == 1.0:
+                            log_pass(n, params, q, p)
+                        else:
+                            self.log.info("Pass #{} quality at scale {}: {}".format(n, scale, q))
+                        ret.append(q)
+
+                    if scale == 1.0:
+                        history.save()
+                return ret
+
+            with lock:
+                points = history.points(key)
+            if len(points) > 0:
+                self.log.info("Resuming optimization with {} points from history".format(len(points)))
+                x0 = [h["x"] for h in points]
+                y0 = [h["q"] for h in points]
+            elif x0 is None:
+                x0, y0 = [], []
+
+            n_pass = 0
+            if x_start is not None and x_start not in x0:
+                x0 = x0 + [x_start]
+                y0 = y0 + objective([x_start], new_passes(1))
+                n_pass += 1
+
+            # Optimizer is set up as in forest_minimize(), but points are asked
+            # in batches which could be evaluated concurrently
+            opt = Optimizer(space, "ET",
+                n_initial_points = OPT_INITIAL_POINTS + len(x0),
+                acq_optimizer = "sampling",
+                n_jobs = -1)
+            res = opt.tell(x0, y0) if len(x0) > 0 else None
+
+            # Patience is counted from the pass where initial random points are over
+            # and the surrogate model is used
+            best = min(y0) if len(y0) > 0 else None
+            n_best = n_pass
+            n_told, n_model = 0, None
+            reason = None
+            while n_pass < max_pass and not stop.is_set():
+                reason = stop_check(best, n_pass - max(n_best, n_model) if n_model is not None else 0)
+                if reason is not None:
+                    break
+
+                # In multi-fidelity mode only a batch of candidates is asked from the optimizer,
+                # the rest are random ones to be screened out cheaply, as in Hyperband
+                n = min(n_batch * OPT_HALVING_RATE ** len(scales), max_pass - n_pass)
+                n_ask = min(n_batch, n)
+                xs = opt.ask(n_points = n_ask) if n_ask > 1 else [opt.ask()]
+                xs.extend(opt.space.rvs(n - n_ask, random_state = opt.rng))
+                passes = new_passes(n)
+
+                # Successive halving
+                # Only full scale results are told to the optimizer, since quality
+                # of screened out candidates on downscaled images is not comparable with them
+                for scale in scales:
+                    if len(xs) <= 1:
+                        break
+                    ys = objective(xs, passes, scale)
+                    idx = np.argsort(ys, kind = 'stable')
+                    n_keep = int(np.ceil(len(xs) / OPT_HALVING_RATE))
+                    xs = [xs[i] for i in idx[:n_keep]]
+                    passes = [passes[i] for i in idx[:n_keep]]
+
+                ys = objective(xs, passes)
+                res = opt.tell(xs, ys)
+                n_pass += n
+                n_told += len(xs)
+                if n_model is None and n_told >= OPT_INITIAL_POINTS:
+                    n_model = n_pass
+                if best is None or min(ys) < best:
+                    best, n_best = min(ys), n_pass
+                with lock:
+                    if callback_fun(res):
+                        stop.set()
+                        reason = "cancelled"
+
+            with lock:
+                if reason is not None:
+                    self.log.info("{} stopped after {} passes: {}".format(
+                        "Optimization" if bw is None else STONE_COLORS[bw] + " stones optimization",
+                        n_pass, reason))
+                if reason is not None or not stop.is_set():
+                    self.stop_reason = reason
+            return res
+
+        if jobs is None or jobs <= 0:
+            jobs = os.cpu_count() or 1
+        jobs = min(jobs, max_pass)
+
+        # Boards with downscaled images for multi-fidelity optimization
+        scales = sorted(fidelity) if fidelity is not None else []
+        if len(scales) > 0:
+            self.log.info("Screening candidates at scales {}".format(scales))
+
+        pool = None
+        fidelity_qc = dict()
+        if jobs > 1:
+            self.log.info("Running {} worker processes".format(jobs))
+            pool = ProcessPoolExecutor(max_workers = jobs,
+                initializer = _init_quality_worker,
+                initargs = (self.board.image, p_start, self.metrics, self.expected, scales))
+        else:
+            for scale in scales:
+                fidelity_qc[scale] = _scaled_optimizer(self.board.image, p_start,
+                    self.metrics, self.expected, scale)
+        try:
+            # Optimization spaces of each color
+            color_spaces = dict()
+            if separable:
+                for bw in [STONE_BLACK, STONE_WHITE]:
+                    keys = [p.key for p in self.board.params.group_params(bw)]
+                    bw_space = [d for d in space if d.name in keys]
+                    if len(bw_space) > 0:
+                        color_spaces[bw] = bw_space
+
+            if len(color_spaces) == 0:
+                x0, y0 = None, None
+                if self.res is not None and self.res.space.dimension_names == names:
+                    self.log.info("Reusing last optimization results as starting points")
+                    x0 = self.res.x_iters
+                    y0 = list(self.res.func_vals)
+                self.res = run_space(space, max_pass, jobs, x0 = x0, y0 = y0)
+            else:
+                n_joint = max(int(max_pass * OPT_JOINT_PART), 1)
+                n_color = max((max_pass - n_joint) // len(color_spaces), 1)
+                if pool is not None and len(color_spaces) > 1:
+                    # Workers are shared by colors
+                    self.log.info("Optimizing colors concurrently")
+                    n_batch = max(jobs // len(color_spaces), 1)
+                    with ThreadPoolExecutor(max_workers = len(color_spaces)) as executor:
+                        futures = {bw: executor.submit(run_space, s, n_color, n_batch, bw,
+                            x_start = [p_base[d.name] for d in s]) for bw, s in color_spaces.items()}
+                        color_res = {bw: f.result() for bw, f in futures.items()}
+                else:
+                    color_res = {bw: run_space(s, n_color, jobs, bw,
+                        x_start = [p_base[d.name] for d in s]) for bw, s in color_spaces.items()}
+
+                # Join best parameters of each color and refine them in a space around them
+                x_start = dict(p_base)
+                for bw, res in color_res.items():
+                    if res is not None:
+                        self.log.info("{} stones quality: {}".format(STONE_COLORS[bw], res.fun))
+                        x_start.update(zip(res.space.dimension_names, res.x))
+                x_start = [int(x_start[k]) for k in names]
+
+                joint_space = []
+                for d, v in zip(space, x_start):
+                    r = max(int(round((d.high - d.low) * OPT_JOINT_RANGE)), 1)
+                    joint_space.extend([Integer(max(d.low, v - r), min(d.high, v + r), name = d.name)])
+
+                self.log.info("Joint refinement")
+                self.res = run_space(joint_space, max_pass - n_color * len(color_spaces), jobs,
+                    x_start = x_start)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        # Best parameters found are applied only if they are better than initial ones,
+        # otherwise parameters changed by passes are restored
+        if self.res is not None and self.res.fun < self.q_init[0]:
+            for k, v in zip(self.res.space.dimension_names, self.res.x):
+                self.board.params[k] = v
+        else:
+            self.log.info("No parameters better than initial ones found, initial parameters are kept")
+            self.board.params = p_base
 
         self.log.debug("Parameters after optimization")
         p_res = self.board.params.todict()
@@ -517,6 +860,79 @@ class BoardOptimizer(object):
 
         self.success = self.q_opt[0] < self.q_init[0]
         self.log.info("Optimization is {}".format("successfull" if self.success else "unsuccessfull"))
+        self.log.info("Optimization made {} passes{}".format(self.npass,
+            "" if self.stop_reason is None else ", stopped: " + self.stop_reason))
         self.log.info("Optimization run took {} seconds".format(self.log.stop()))
 
         return self.success
+
+def scale_params(params, scale):
+    """Rescale parameters measured in pixels for board image resized by scale.
+
+    Parameters:
+        params      Dictionary of parameters
+        scale       Image scale
+
+    Returns:
+        Dictionary of rescaled parameters
+    """
+    p = dict(params)
+    for k in OPT_PIXEL_PARAMS:
+        # Zero sizes mean filters are off
+        if not p.get(k):
+            continue
+        # Stones are detected on board resampled to fixed cell size
+        if p.get('STONES_CELL_SIZE') and k.startswith(('HC_', 'BLUR_')):
+            continue
+        # HoughCircles limits derived from board spacing are rescaled with the image,
+        # explicit limits of auto mode (HC_AUTO_*) are rescaled as fixed ones
+        if p.get('HC_AUTO') and k in ['HC_MINDIST', 'HC_MAXRADIUS']:
+            continue
+        p[k] = max(int(round(p[k] * scale)), 1)
+
+    # HoughLines threshold below 10 is replaced with 90 by find_board(),
+    # so it is rescaled from the value actually used and kept not less than 10,
+    # as in coarse board detection
+    if p.get('HL_THRESHOLD2') is not None:
+        n_thresh = p['HL_THRESHOLD2'] if p['HL_THRESHOLD2'] >= 10 else 90
+        p['HL_THRESHOLD2'] = max(int(round(n_thresh * scale)), 10)
+
+    for k in OPT_PIXEL_AREAS:
+        if p.get(k) is not None:
+            p[k] = np.round(np.array(p[k]) * scale).astype(np.int64).tolist()
+    return p
+
+def _scaled_optimizer(image, params, metrics, expected, scale):
+    """Internal - make an optimizer for board image resized by scale"""
+    qc = BoardOptimizer(board = GrBoard())
+    qc.scale = scale
+    if scale != 1.0:
+        image = cv2.resize(image, None, fx = scale, fy = scale, interpolation = cv2.INTER_AREA)
+    qc.board.image = image
+    qc.board.params.assign(scale_params(params, scale), copy_all = True)
+    qc.metrics = metrics
+    qc.expected = expected
+    return qc
+
+# Optimization worker process state
+# Every worker holds its own optimizers with a board and a copy of board image
+# for full scale and every scale of multi-fidelity optimization
+_worker_qc = None
+
+def _init_quality_worker(image, params, metrics, expected, scales = ()):
+    """Internal - optimization worker process initializer"""
+    global _worker_qc
+
+    # Passes are evaluated concurrently by workers, so OpenCV internal threading
+    # would only compete with other workers for the same cores
+    cv2.setNumThreads(1)
+
+    _worker_qc = {scale: _scaled_optimizer(image, params, metrics, expected, scale) \
+        for scale in [1.0] + list(scales)}
+
+def _quality_worker(params, bw = None, scale = 1.0):
+    """Internal - evaluate quality of parameters combination in a worker process.
+    Returns quality as BoardOptimizer.quality() does and evaluation time"""
+    t = perf_counter()
+    _worker_qc[scale].board.params = params
+    return _worker_qc[scale].quality(bw = bw), perf_counter() - t
@@ -0,0 +1,129 @@
+#-------------------------------------------------------------------------------
+# Name:        Go board recognition project
+# Purpose:     Persistent history of parameters optimization
+#
+# Author:      kol
+#
+# Created:     18.10.2026
+# Copyright:   (c) kol 2019-2026
+# Licence:     MIT
+#-------------------------------------------------------------------------------
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+from pathlib import Path
+
+HISTORY_EXT = '.gopt'       # extension for optimization history file
+
+# Internal function: convert numpy values to JSON serializable form
+def _to_json(v):
+    if isinstance(v, dict):
+        return {str(k): _to_json(x) for k, x in v.items()}
+    elif isinstance(v, (list, tuple, np.ndarray)):
+        return [_to_json(x) for x in v]
+    elif isinstance(v, np.generic):
+        return v.item()
+    else:
+        return v
+
+class GrOptHistory(object):
+    """Persistent history of parameters optimization.
+
+    Every parameters combination evaluated during optimization is stored with its
+    quality, per-metric scores and evaluation time. Points are grouped into runs
+    identified by a key built from image contents, optimization space definition,
+    values of parameters which are not optimized and quality metrics, so points of a run stay valid
+    as long as the key is the same. History is kept in a JSON file, which is
+    normally placed next to board image (see HISTORY_EXT). Points of a run are
+    indexed by parameter values, so a point is found without scanning the run.
+    """
+
+    def __init__(self, filename = None):
+        """Constructor
+
+        Parameters:
+            filename    History file name. If None, history is kept in memory only.
+                        If the file exists, history is loaded from it
+        """
+        self.filename = str(filename) if filename is not None else None
+        self.__runs = dict()
+        self.__index = dict()
+
+        if self.filename is not None and Path(self.filename).is_file():
+            try:
+                with open(self.filename) as f:
+                    self.__runs = json.load(f).get("runs", dict())
+            except (ValueError, OSError):
+                logging.exception("Cannot load optimization history from {}".format(self.filename))
+
+        for key, run in self.__runs.items():
+            self.__index[key] = {tuple(p["x"]): p for p in run["points"]}
+
+    @staticmethod
+    def make_key(image, space, params, metrics = None):
+        """Make a key of optimization run.
+
+        Parameters:
+            image       Board image
+            space       Optimization space (list of skopt dimensions)
+            params      Dictionary of parameter values which are not optimized
+            metrics     List of quality metrics (metric class, weight, groups) used
+                        to estimate quality
+
+        Returns:
+            Key string
+        """
+        h = hashlib.sha1()
+        h.update(str(image.shape).encode())
+        h.update(np.ascontiguousarray(image).data)
+        h.update(json.dumps(_to_json([[d.name, d.low, d.high] for d in space])).encode())
+        h.update(json.dumps(_to_json(params), sort_keys = True).encode())
+        if metrics is not None:
+            h.update(json.dumps([[m[0].__name__, m[1]] for m in metrics]).encode())
+        return h.hexdigest()
+
+    def points(self, key):
+        """List of points of a run. Every point is a dictionary with keys
+        x (list of parameter values in order of space), q (quality),
+        metrics (dictionary of metric scores) and time (evaluation time, seconds)"""
+        run = self.__runs.get(key)
+        return run["points"] if run is not None else []
+
+    def find(self, key, x):
+        """Find a point of a run by parameter values. Returns None if not found"""
+        index = self.__index.get(key)
+        return index.get(tuple(_to_json(x))) if index is not None else None
+
+    def add(self, key, space, x, q, metrics, t):
+        """Add a point to a run.
+
+        Parameters:
+            key         Run key (see make_key())
+            space       Optimization space (list of skopt dimensions)
+            x           List of parameter values in order of space
+            q           Quality
+            metrics     Dictionary of metric scores as returned by BoardOptimizer.quality()
+            t           Evaluation time, seconds
+        """
+        run = self.__runs.get(key)
+        if run is None:
+            run = {"space": [d.name for d in space], "points": []}
+            self.__runs[key] = run
+            self.__index[key] = dict()
+
+        p = {"x": _to_json(x), "q": float(q), "metrics": _to_json(metrics), "time": round(t, 3)}
+        run["points"].append(p)
+        self.__index[key][tuple(p["x"])] = p
+
+    def save(self):
+        """Save history to file. File is replaced atomically,
+        so an interrupted save does not damage existing history"""
+        if self.filename is None:
+            return
+
+        tmp = self.filename + '.tmp'
+        with open(tmp, "w") as f:
+            json.dump({"runs": self.__runs}, f, ensure_ascii = False)
+        os.replace(tmp, self.filename)
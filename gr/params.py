@@ -45,6 +45,24 @@ GR_PARAMS = {
         "title": "Threshold", "n": 3},                                          # HoughLinesP threshold
     'LUM_EQ': {"v": 0, "min_v": 0, "max_v": 1, "g": GROUP_BOARD,
         "title": "Luminosity filter", "n": 4},                                  # CLAHE filter on/off
+    'GRID_PROFILE': {"v": 0, "min_v": 0, "max_v": 1, "g": GROUP_BOARD,
+        "title": "Fast grid detection", "n": 5, "no_opt": True},                # Projection profile grid detection on/off
+    'GRID_ESTIMATE': {"v": 0, "min_v": 0, "max_v": 1, "g": GROUP_BOARD,
+        "title": "Grid estimation", "n": 6, "no_opt": True},                    # Narrow lines search by grid estimation on/off
+    'BOARD_PYRAMID': {"v": 0, "min_v": 0, "max_v": 3, "g": GROUP_BOARD,
+        "title": "Downscale levels", "n": 7, "no_opt": True},                   # Number of 2x downscales for coarse detection
+    'STONES_CELL_SIZE': {"v": 0, "min_v": 0, "max_v": 64, "g": GROUP_BOARD,
+        "title": "Stones cell size", "n": 8, "no_opt": True},                   # Board cell size for stones detection (0 - as is)
+    'STONES_SAMPLING': {"v": 0, "min_v": 0, "max_v": 1, "g": GROUP_BOARD,
+        "title": "Intersection sampling", "n": 9, "no_opt": True},              # Stones detection by sampling grid intersections on/off
+    'HC_AUTO': {"v": 0, "min_v": 0, "max_v": 1, "g": GROUP_BOARD,
+        "title": "Auto circles size", "n": 10, "no_opt": True},                 # HoughCircles limits derived from spacing on/off
+    'STONES_JOINT': {"v": 0, "min_v": 0, "max_v": 20, "g": GROUP_BOARD,
+        "title": "Joint detection sensitivity", "n": 11, "no_opt": True},       # Black and white stones detection in one pass (0 - off)
+    'HC_AUTO_MINDIST': {"v": 0, "min_v": 0, "max_v": 80, "g": GROUP_BOARD,
+        "title": "Auto circles distance", "n": 12, "no_opt": True},             # HoughCircles min distance in auto mode (0 - derived from spacing)
+    'HC_AUTO_MAXRADIUS': {"v": 0, "min_v": 0, "max_v": 80, "g": GROUP_BOARD,
+        "title": "Auto circles radius", "n": 13, "no_opt": True},               # HoughCircles max radius in auto mode (0 - derived from spacing)
 
     # Black stones detection
     "STONES_THRESHOLD_B": {"v": 84, "min_v": 1, "max_v": 255, "g": GROUP_BLACK,
@@ -63,8 +81,12 @@ GR_PARAMS = {
         "title": "Watershed threshold", "n": 7, "opt_maxv": 150},               # Watershed
     "WS_MORPH_B": {"v": 0, "min_v": 0, "max_v": 5, "g": GROUP_BLACK,
         "title": "Watershed morphing", "n": 8, "opt_maxv": 3},                  # WS morphing
-    "PYRAMID_B": {"v": 0, "min_v": 0, "max_v": 1, "g": GROUP_BLACK,
-        "title": "Pyramid filter", "n": 9, "no_opt" : True},                    # Image pyramid filter on/off
+    "PYRAMID_B": {"v": 0, "min_v": 0, "max_v": 2, "g": GROUP_BLACK,
+        "title": "Pyramid filter", "n": 9, "no_opt" : True},                    # Image pyramid filter (0 - off, 1 - full, 2 - fast)
+    "TEMPLATE_B": {"v": 0, "min_v": 0, "max_v": 100, "g": GROUP_BLACK,
+        "title": "Template matching", "n": 10, "no_opt": True},                 # Template matching threshold (0 - off)
+    "DIST_TRANSFORM_B": {"v": 0, "min_v": 0, "max_v": 1, "g": GROUP_BLACK,
+        "title": "Distance transform", "n": 11, "no_opt": True},                # Distance transform instead of HoughCircles on/off (experimental)
     "STONES_MAXVAL_B": {"v": 255, "min_v": 0, "max_v": 255,
         "no_copy": True, "no_opt": True},                                       # MaxVal - cannot be changed
 
@@ -85,8 +107,12 @@ GR_PARAMS = {
         "g": GROUP_WHITE, "title": "Watershed threshold", "n": 7},                      # Watershed
     "WS_MORPH_W": {"v": 0, "min_v": 0, "max_v": 5, "g": GROUP_WHITE,
         "title": "Watershed morphing", "n": 8, "opt_maxv": 3},                  # WS morphing
-    "PYRAMID_W": {"v": 0, "min_v": 0, "max_v": 1, "g": GROUP_WHITE,
-        "title": "Pyramid filter", "n": 9, "no_opt": True},                     # Image pyramid filter on/off
+    "PYRAMID_W": {"v": 0, "min_v": 0, "max_v": 2, "g": GROUP_WHITE,
+        "title": "Pyramid filter", "n": 9, "no_opt": True},                     # Image pyramid filter (0 - off, 1 - full, 2 - fast)
+    "TEMPLATE_W": {"v": 0, "min_v": 0, "max_v": 100, "g": GROUP_WHITE,
+        "title": "Template matching", "n": 10, "no_opt": True},                 # Template matching threshold (0 - off)
+    "DIST_TRANSFORM_W": {"v": 0, "min_v": 0, "max_v": 1, "g": GROUP_WHITE,
+        "title": "Distance transform", "n": 11, "no_opt": True},                # Distance transform instead of HoughCircles on/off (experimental)
     "STONES_MAXVAL_W": {"v": 255, "min_v": 0, "max_v": 255,
         "no_copy": True, "no_opt": True},                                       # MaxVal - cannot be changed
 
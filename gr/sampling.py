@@ -0,0 +1,216 @@
+#-------------------------------------------------------------------------------
+# Name:        Go board recognition project
+# Purpose:     Stones detection by sampling board grid intersections
+#
+# Author:      kol
+#
+# Created:     18.10.2026
+# Copyright:   (c) kol 2019-2026
+# Licence:     MIT
+#-------------------------------------------------------------------------------
+import numpy as np
+import logging
+import cv2
+
+from .grdef import *
+
+SAMPLE_AREA = 0.35          # half size of sampled box relative to board spacing
+STONE_RADIUS = 0.45         # radius of found stones relative to board spacing
+MIN_STONE_FILL = 0.3        # minimum part of a sampled box covered by a stone
+MIN_TEMPLATE_STONES = 3     # minimum number of stones to build a template from
+MAX_TEMPLATE_STONES = 20    # maximum number of stones to build a template from
+MAX_TEMPLATE_SHIFT = 0.15   # maximum shift of template stones from intersections relative to spacing
+MAX_RADIUS_DEVIATION = 0.2  # maximum deviation of template stones radius from median radius
+MAX_TEMPLATE_SIZE = 24      # maximum size of a template to match, larger images are downscaled
+
+def intersections(res):
+    """Calculate coordinates of all board grid intersections.
+
+    Parameters:
+        res     Results dictionary (edges, size and spacing must be set)
+
+    Returns:
+        Numpy array of shape (size*size, 4) with (X, Y, A, B) of every intersection
+    """
+    edges = res[GR_EDGES]
+    size = res[GR_BOARD_SIZE]
+    space_x, space_y = res[GR_SPACING]
+
+    # Intersections are ordered by position (A, B) as convert_xy() results are
+    a, b = np.meshgrid(np.arange(size), np.arange(size)[::-1], indexing = 'ij')
+    a, b = a.ravel(), b.ravel()
+
+    p = np.empty((len(a), 4), dtype = np.float64)
+    p[:, GR_X] = edges[0][0] + a * space_x
+    p[:, GR_Y] = edges[0][1] + b * space_y
+    p[:, GR_A] = a + 1
+    p[:, GR_B] = size - b
+    return p
+
+def box_mean(sums, points, half):
+    """Calculate mean of image values over square boxes using an integral image.
+
+    Parameters:
+        sums        Integral image (cv2.integral output)
+        points      Array of box centers (X, Y)
+        half        Half size of a box
+
+    Returns:
+        Array of mean values for every box
+    """
+    h, w = sums.shape[0] - 1, sums.shape[1] - 1
+    x = np.round(points[:, GR_X]).astype(np.int64)
+    y = np.round(points[:, GR_Y]).astype(np.int64)
+    x0, x1 = np.clip(x - half, 0, w), np.clip(x + half + 1, 0, w)
+    y0, y1 = np.clip(y - half, 0, h), np.clip(y + half + 1, 0, h)
+
+    s = sums[y1, x1] - sums[y0, x1] - sums[y1, x0] + sums[y0, x0]
+    return s / np.maximum((x1 - x0) * (y1 - y0), 1)
+
+def stones_integral(img, f_bw, threshold):
+    """Threshold a channel used to detect stones of given color
+    (red for black stones, blue for white ones, as in find_stones())
+    and calculate integral image of the stones mask.
+
+    Parameters:
+        img         Source image
+        f_bw        Either B or W for black and white stones
+        threshold   Channel threshold (STONES_THRESHOLD_B or STONES_THRESHOLD_W)
+
+    Returns:
+        Integral image of the mask
+    """
+    channel = cv2.extractChannel(img, 2 if f_bw == STONE_BLACK else 0)
+    method = cv2.THRESH_BINARY_INV if f_bw == STONE_BLACK else cv2.THRESH_BINARY
+    _, mask = cv2.threshold(channel, threshold, 1, method)
+    return cv2.integral(mask, sdepth = cv2.CV_32S)
+
+def sample_stones(sums, res):
+    """Find stones by sampling stones mask at all board grid intersections at once.
+
+    A box around every intersection is considered as a stone if enough of it
+    is covered by stone-colored pixels. Mean value of the mask over a box is the covered part,
+    so it is evaluated with an integral image without scanning the image.
+
+    Parameters:
+        sums        Integral image of stones mask (see stones_integral())
+        res         Results dictionary (edges, size and spacing must be set)
+
+    Returns:
+        numpy array (X, Y, A, B, R) or None
+    """
+    if res.get(GR_EDGES) is None or res.get(GR_SPACING) is None:
+        return None
+
+    space = min(res[GR_SPACING])
+    points = intersections(res)
+    fill = box_mean(sums, points, max(int(space * SAMPLE_AREA), 1))
+
+    found = fill >= MIN_STONE_FILL
+    if not np.any(found):
+        return None
+
+    stones = np.empty((np.sum(found), 5), dtype = np.int64)
+    stones[:, [GR_X, GR_Y, GR_A, GR_B]] = np.round(points[found])
+    stones[:, GR_R] = round(space * STONE_RADIUS)
+    return stones
+
+def template_stones(stones, res):
+    """Select stones to build a template from: stones which are close to
+    grid intersections and have typical radius.
+
+    Parameters:
+        stones      Stones found by previous filters (X, Y, A, B, R)
+        res         Results dictionary (edges, size and spacing must be set)
+
+    Returns:
+        numpy array of selected stones, best first
+    """
+    if stones is None or len(stones) == 0:
+        return np.empty((0, 5), dtype = np.int64)
+
+    edges = res[GR_EDGES]
+    space = min(res[GR_SPACING])
+    x = edges[0][0] + (stones[:, GR_A] - 1) * res[GR_SPACING][GR_X]
+    y = edges[0][1] + (res[GR_BOARD_SIZE] - stones[:, GR_B]) * res[GR_SPACING][GR_Y]
+    dist = np.hypot(stones[:, GR_X] - x, stones[:, GR_Y] - y)
+
+    r = np.median(stones[:, GR_R])
+    good = (dist <= space * MAX_TEMPLATE_SHIFT) & \
+           (np.abs(stones[:, GR_R] - r) <= r * MAX_RADIUS_DEVIATION)
+    idx = np.argsort(dist[good], kind = 'stable')[:MAX_TEMPLATE_STONES]
+    return stones[good][idx]
+
+def match_stones(img, stones, res, threshold):
+    """Find stones by matching a stone template at grid intersections.
+
+    The template is built from the image itself by averaging areas around
+    high-confidence stones found by previous filters. Then the template is matched
+    with the board area in one call and every intersection with correlation
+    above the threshold is considered as a stone. Large images are downscaled
+    so the template is not larger than MAX_TEMPLATE_SIZE.
+
+    Parameters:
+        img         Source image (single channel)
+        stones      Stones found by previous filters (X, Y, A, B, R)
+        res         Results dictionary (edges, size and spacing must be set)
+        threshold   Minimum normalized correlation (0..1)
+
+    Returns:
+        numpy array of found stones (X, Y, R) or None,
+        correlation map image or None
+    """
+    if res.get(GR_EDGES) is None or res.get(GR_SPACING) is None:
+        return None, None
+
+    # Template covers a grid cell around a stone
+    space = min(res[GR_SPACING])
+    r = max(int(space / 2), 1)
+    h, w = img.shape[:2]
+
+    calib = template_stones(stones, res)
+    calib = calib[(calib[:, GR_X] >= r) & (calib[:, GR_X] < w - r) &
+                  (calib[:, GR_Y] >= r) & (calib[:, GR_Y] < h - r)]
+    if len(calib) < MIN_TEMPLATE_STONES:
+        logging.info("Not enough stones to build a template")
+        return None, None
+
+    patches = [img[y - r:y + r + 1, x - r:x + r + 1] for x, y in calib[:, [GR_X, GR_Y]]]
+    templ = np.mean(patches, axis = 0).astype(np.uint8)
+    logging.info("Stone template built from {} stones".format(len(calib)))
+
+    # Board area with a margin for the template
+    edges = res[GR_EDGES]
+    x0, y0 = max(int(edges[0][0]) - r, 0), max(int(edges[0][1]) - r, 0)
+    x1, y1 = min(int(edges[1][0]) + r + 1, w), min(int(edges[1][1]) + r + 1, h)
+    area = img[y0:y1, x0:x1]
+
+    scale = min(1.0, MAX_TEMPLATE_SIZE / float(2 * r + 1))
+    if scale < 1.0:
+        templ = cv2.resize(templ, None, fx = scale, fy = scale, interpolation = cv2.INTER_AREA)
+        area = cv2.resize(area, None, fx = scale, fy = scale, interpolation = cv2.INTER_AREA)
+    if area.shape[0] < templ.shape[0] or area.shape[1] < templ.shape[1]:
+        return None, None
+
+    corr = cv2.matchTemplate(area, templ, cv2.TM_CCOEFF_NORMED)
+
+    # Take best correlation near every intersection
+    d = max(int(space * scale * MAX_TEMPLATE_SHIFT), 1)
+    corr_max = cv2.dilate(corr, np.ones((2 * d + 1, 2 * d + 1), np.uint8))
+
+    points = intersections(res)
+    cx = np.round((points[:, GR_X] - x0) * scale).astype(np.int64) - templ.shape[1] // 2
+    cy = np.round((points[:, GR_Y] - y0) * scale).astype(np.int64) - templ.shape[0] // 2
+    cx = np.clip(cx, 0, corr.shape[1] - 1)
+    cy = np.clip(cy, 0, corr.shape[0] - 1)
+    found = corr_max[cy, cx] >= threshold
+
+    dbg_img = cv2.normalize(np.maximum(corr, 0), None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+    if not np.any(found):
+        return None, dbg_img
+
+    new_stones = np.empty((np.sum(found), 3), dtype = np.int64)
+    new_stones[:, 0] = np.round(points[found, GR_X])
+    new_stones[:, 1] = np.round(points[found, GR_Y])
+    new_stones[:, 2] = np.median(calib[:, GR_R])
+    return new_stones, dbg_img
@@ -17,6 +17,7 @@ import numpy as np
 from PIL import Image, ImageTk
 import string as ss
 from random import randint
+from functools import lru_cache
 
 def show(title, img):
     """Show an image and wait for key press"""
@@ -68,12 +69,10 @@ def show_stones(title, shape, points, color = None, img = None):
 def make_lines_img(shape, lines, width = 1, color = COLOR_BLACK, img = None):
     if (img is None):
        img = np.full(shape, COLOR_WHITE[0], dtype=np.uint8)
-    for i in lines:
-        x1 = i[GR_FROM][GR_X]
-        y1 = i[GR_FROM][GR_Y]
-        x2 = i[GR_TO][GR_X]
-        y2 = i[GR_TO][GR_Y]
-        cv2.line(img, (x1,y1), (x2,y2), color, width)
+    if len(lines) > 0:
+       # All lines are drawn at once as 2-point polylines
+       pts = np.asarray(lines).reshape(-1, 2, 2).astype(np.int32)
+       cv2.polylines(img, list(pts), False, color, width)
 
     return img
 
@@ -110,9 +109,14 @@ def img1_to_img3(img):
     if len(img.shape) > 2:
        raise ValueError('Image is not 1-channel')
 
-    img3 = np.empty((img.shape[0], img.shape[1], 3), dtype=np.uint8)
-    for i in range(3): img3[:,:,i] = img
-    return img3
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+
+@lru_cache(maxsize = 64)
+def ellipse_kernel(size):
+    """Elliptic structuring element of given size.
+    Kernels are cached, so they should not be modified"""
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,(100,100))
+    return cv2.resize(kernel, (size,size))
 
 def format_stone_pos(stone, axis = None):
     if stone is None:
@@ -314,7 +318,8 @@ def get_image_area(img, r):
         r        Area to extract (list or tuple [x1,y1,x2,y2])
 
     Returns:
-        Extracted area
+        Extracted area. This is a view of source image, so it should be copied
+        before modification
     """
     if r[0] < 0 or r[1] < 0:
        raise ValueError('Invalid area origin: {}'.format(r))
@@ -323,14 +328,7 @@ def get_image_area(img, r):
     if dx <= 0 or dy <= 0:
        raise ValueError('Invalid area length: {}'.format(r))
 
-    im = None
-    if len(img.shape) > 2:
-       im = np.empty((dy, dx, img.shape[2]), dtype=img.dtype)
-    else:
-       im = np.empty((dy, dx), dtype=img.dtype)
-
-    im[:] = img[r[1]:r[3], r[0]:r[2]]
-    return im
+    return img[r[1]:r[3], r[0]:r[2]]
 
 def is_on(a, b, c):
     """Return true if point c is exactly on the line from a to b"""
@@ -0,0 +1,94 @@
+#-------------------------------------------------------------------------------
+# Name:        Go board recognition project
+# Purpose:     Batch recognition tests
+#
+# Author:      kol
+#
+# Created:     18.10.2026
+# Copyright:   (c) kol 2019-2026
+# Licence:     MIT
+#-------------------------------------------------------------------------------
+import os
+import sys
+import json
+import logging
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from gr.board import GrBoard
+from gr.batch import list_images, process_file, process_batch
+from gr.__main__ import main
+
+IMG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'img')
+IMG_FILES = [os.path.join(IMG_DIR, 'go_board_{}.png'.format(n)) for n in (1, 10, 100)]
+
+def test_list_images(tmp_path):
+    for f in ('b.png', 'a.JPG', 'c.jpeg', 'a.gpar', 'notes.txt'):
+        (tmp_path / f).write_bytes(b'')
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'd.png').write_bytes(b'')
+
+    # Directories are not scanned recursively, other files are skipped
+    files = list_images([str(tmp_path)])
+    assert [f.name for f in files] == ['a.JPG', 'b.png', 'c.jpeg']
+
+    # Files listed more than once are taken once
+    files = list_images([str(tmp_path / '*.png'), str(tmp_path / 'b.png'),
+                         str(tmp_path / 'sub' / 'd.png'), str(tmp_path / 'missing.png')])
+    assert [f.name for f in files] == ['b.png', 'd.png']
+
+def test_process_file(tmp_path):
+    logging.disable(logging.CRITICAL)
+    r = process_file(IMG_FILES[0], str(tmp_path))
+
+    board = GrBoard(debug = False)
+    board.load_image(IMG_FILES[0])
+    logging.disable(logging.NOTSET)
+
+    assert r["error"] is None
+    assert r["params"]
+    assert (r["black"], r["white"]) == (len(board.black_stones), len(board.white_stones))
+    assert r["outputs"] == [str(tmp_path / 'go_board_1.sgf'), str(tmp_path / 'go_board_1.jgf')]
+    assert all(os.path.isfile(f) for f in r["outputs"])
+    with open(r["outputs"][1]) as f:
+        assert len(json.load(f)) > 0
+
+def test_process_file_error(tmp_path):
+    logging.disable(logging.CRITICAL)
+    r = process_file(str(tmp_path / 'missing.png'), str(tmp_path))
+    assert r["error"] is not None
+    assert r["outputs"] == []
+
+    r = process_file(IMG_FILES[0], str(tmp_path), ['png'])
+    assert r["error"] is not None
+    logging.disable(logging.NOTSET)
+
+def test_process_batch(tmp_path):
+    # Parallel processing returns the same results as serial one, in order of files
+    logging.disable(logging.CRITICAL)
+    done = []
+    serial = process_batch(IMG_FILES, jobs = 1, out_dir = str(tmp_path / 'serial'),
+        formats = ['sgf'], callback = lambda r: done.append(r["file"]))
+    parallel = process_batch(IMG_FILES, jobs = 2, out_dir = str(tmp_path / 'parallel'),
+        formats = ['sgf'])
+    logging.disable(logging.NOTSET)
+
+    assert [r["file"] for r in serial] == IMG_FILES
+    assert [r["file"] for r in parallel] == IMG_FILES
+    assert done == IMG_FILES
+    for r1, r2 in zip(serial, parallel):
+        assert r1["error"] is None and r2["error"] is None
+        assert (r1["black"], r1["white"]) == (r2["black"], r2["white"])
+        with open(r1["outputs"][0]) as f1, open(r2["outputs"][0]) as f2:
+            assert f1.read() == f2.read()
+
+def test_process_batch_empty():
+    assert process_batch([], jobs = 4) == []
+
+def test_main_no_formats(monkeypatch, capsys):
+    # Format option without values is an error, not a run without outputs
+    monkeypatch.setattr(sys, 'argv', ['gr', IMG_FILES[0], '-f'])
+    with pytest.raises(SystemExit) as e:
+        main()
+    assert e.value.code == 2
+    assert 'format' in capsys.readouterr().err
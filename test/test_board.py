@@ -0,0 +1,34 @@
+#-------------------------------------------------------------------------------
+# Name:        Go board recognition project
+# Purpose:     Board class tests
+#
+# Author:      kol
+#
+# Created:     18.10.2026
+# Copyright:   (c) kol 2019-2026
+# Licence:     MIT
+#-------------------------------------------------------------------------------
+import os
+import sys
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from gr.board import GrBoard
+
+IMG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'img', 'go_board_1.png')
+
+def images_size(images):
+    return sum(images[key].nbytes for key in images)
+
+def test_debug_budget():
+    # Debug images are regenerated when the budget changes after they were taken
+    logging.disable(logging.CRITICAL)
+    board = GrBoard(IMG_FILE, debug = False)
+    full_size = images_size(board.debug_images)
+
+    board.debug_budget = full_size // 4
+    assert images_size(board.debug_images) <= full_size // 4
+
+    board.debug_budget = None
+    assert images_size(board.debug_images) == full_size
+    logging.disable(logging.NOTSET)
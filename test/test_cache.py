@@ -0,0 +1,180 @@
+#-------------------------------------------------------------------------------
+# Name:        Go board recognition project
+# Purpose:     Stage cache tests
+#
+# Author:      kol
+#
+# Created:     18.10.2026
+# Copyright:   (c) kol 2019-2026
+# Licence:     MIT
+#-------------------------------------------------------------------------------
+import os
+import sys
+import logging
+import numpy as np
+import pytest
+from threading import Thread, Event
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from gr.cache import GrStageCache
+
+# Stage function counting its calls
+class Stage(object):
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, img):
+        self.calls += 1
+        return img + 1
+
+def test_memoized():
+    cache = GrStageCache()
+    stage = Stage()
+    img = np.zeros((10, 10), dtype = np.uint8)
+
+    r1 = cache.run('STAGE', [img], [1, [2, 3]], lambda: stage(img))
+    r2 = cache.run('STAGE', [img], [1, [2, 3]], lambda: stage(img))
+    assert r1 is r2
+    assert stage.calls == 1
+    assert cache.hits == 1 and cache.misses == 1
+
+def test_params_change():
+    cache = GrStageCache()
+    stage = Stage()
+    img = np.zeros((10, 10), dtype = np.uint8)
+
+    cache.run('STAGE', [img], [1], lambda: stage(img))
+    cache.run('STAGE', [img], [2], lambda: stage(img))
+    cache.run('OTHER', [img], [2], lambda: stage(img))
+    assert stage.calls == 3
+
+    cache.run('STAGE', [img], [1], lambda: stage(img))
+    assert stage.calls == 3
+
+def test_inputs_identity():
+    # Inputs are compared by identity, not by value
+    cache = GrStageCache()
+    stage = Stage()
+    img1 = np.zeros((10, 10), dtype = np.uint8)
+    img2 = img1.copy()
+
+    cache.run('STAGE', [img1], [], lambda: stage(img1))
+    cache.run('STAGE', [img2], [], lambda: stage(img2))
+    assert stage.calls == 2
+
+def test_reused_id():
+    # An output of released input must not be returned for a new object with the same id
+    cache = GrStageCache()
+    stage = Stage()
+    img = np.zeros((10, 10), dtype = np.uint8)
+    img_id = id(img)
+    cache.run('STAGE', [img], [], lambda: stage(img))
+    img = None
+
+    keep = []
+    for _ in range(100):
+        new_img = np.full((10, 10), 5, dtype = np.uint8)
+        if id(new_img) == img_id:
+            break
+        keep.append(new_img)
+    else:
+        pytest.skip("Object id was not reused")
+
+    r = cache.run('STAGE', [new_img], [], lambda: stage(new_img))
+    assert stage.calls == 2
+    assert r[0, 0] == 6
+
+def test_none_input():
+    cache = GrStageCache()
+    stage = Stage()
+    cache.run('STAGE', [None], [], lambda: stage(0))
+    cache.run('STAGE', [None], [], lambda: stage(0))
+    assert stage.calls == 1
+
+def test_wait_in_flight():
+    # Second request of a running stage waits for its output
+    cache = GrStageCache()
+    img = np.zeros((10, 10), dtype = np.uint8)
+    started, release = Event(), Event()
+    calls = []
+
+    def slow_stage():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return img + 1
+
+    results = [None, None]
+    def run(n):
+        results[n] = cache.run('STAGE', [img], [], slow_stage)
+
+    t1 = Thread(target = run, args = (0,))
+    t1.start()
+    assert started.wait(5)
+
+    t2 = Thread(target = run, args = (1,))
+    t2.start()
+    t2.join(0.2)
+    assert t2.is_alive()
+
+    release.set()
+    t1.join(5)
+    t2.join(5)
+    assert len(calls) == 1
+    assert results[0] is results[1]
+
+def test_exception():
+    # Failed stage is not cached and does not block further requests
+    cache = GrStageCache()
+    stage = Stage()
+    img = np.zeros((10, 10), dtype = np.uint8)
+
+    def failed():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        cache.run('STAGE', [img], [], failed)
+    cache.run('STAGE', [img], [], lambda: stage(img))
+    assert stage.calls == 1
+
+def test_eviction():
+    # Least recently used outputs are evicted when size limit is exceeded
+    img = np.zeros((10, 10), dtype = np.uint8)
+    cache = GrStageCache(max_size = 2 * img.nbytes)
+    stage = Stage()
+
+    cache.run('STAGE', [img], [1], lambda: stage(img))
+    cache.run('STAGE', [img], [2], lambda: stage(img))
+    cache.run('STAGE', [img], [1], lambda: stage(img))
+    cache.run('STAGE', [img], [3], lambda: stage(img))
+    assert len(cache) == 2
+    assert cache.size == 2 * img.nbytes
+
+    cache.run('STAGE', [img], [1], lambda: stage(img))
+    assert stage.calls == 3
+    cache.run('STAGE', [img], [2], lambda: stage(img))
+    assert stage.calls == 4
+
+def test_disabled():
+    cache = GrStageCache(max_size = 0)
+    stage = Stage()
+    img = np.zeros((10, 10), dtype = np.uint8)
+
+    cache.run('STAGE', [img], [], lambda: stage(img))
+    cache.run('STAGE', [img], [], lambda: stage(img))
+    assert stage.calls == 2
+    assert len(cache) == 0
+
+def test_log_replay(caplog):
+    # Log records of a stage are emitted again when cached output is returned
+    cache = GrStageCache()
+    img = np.zeros((10, 10), dtype = np.uint8)
+
+    def stage():
+        logging.info("Stage message")
+        return img + 1
+
+    with caplog.at_level(logging.INFO):
+        cache.run('STAGE', [img], [], stage)
+        cache.run('STAGE', [img], [], stage)
+    assert [r.getMessage() for r in caplog.records].count("Stage message") == 2
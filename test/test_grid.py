@@ -0,0 +1,154 @@
+#-------------------------------------------------------------------------------
+# Name:        Go board recognition project
+# Purpose:     Grid detection tests
+#
+# Author:      kol
+#
+# Created:     18.10.2026
+# Copyright:   (c) kol 2019-2026
+# Licence:     MIT
+#-------------------------------------------------------------------------------
+import os
+import sys
+import json
+import glob
+import logging
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from gr.grdef import *
+from gr.params import GrParams
+from gr.gr import find_board
+from gr.grid import detect_grid, shift_grid_lines, profile_period, profile_phase, estimate_grid, \
+    grid_filter_lines, MIN_GRID_CONFIDENCE
+
+IMG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'img')
+EDGES_TOLERANCE = 5         # allowed distance of detected board edges from known ones
+
+# Make an edges image of a board grid with size lines starting at origin
+# Canny finds both sides of a line, so every line makes two edges
+def grid_edges(size, origin, spacing, shape):
+    edges = np.zeros(shape, dtype = np.uint8)
+    last = origin + (size - 1) * spacing
+    for i in range(size):
+        p = origin + i * spacing
+        edges[origin:last + 1, [p - 1, p + 1]] = 255
+        edges[[p - 1, p + 1], origin:last + 1] = 255
+    return edges
+
+def test_detect_grid():
+    edges = grid_edges(19, 30, 20, (420, 420))
+    grid = detect_grid(edges, [19])
+
+    assert grid is not None
+    assert grid['confidence'] >= MIN_GRID_CONFIDENCE
+    assert list(grid['x']) == list(range(30, 391, 20))
+    assert list(grid['y']) == list(range(30, 391, 20))
+
+def test_detect_grid_no_grid():
+    edges = np.zeros((200, 200), dtype = np.uint8)
+    assert detect_grid(edges, [19]) is None
+
+def test_detect_grid_lines_mismatch():
+    # Grid of 19 vertical and 13 horizontal lines is not a board
+    edges = np.zeros((420, 420), dtype = np.uint8)
+    for i in range(19):
+        p = 30 + i * 20
+        edges[30:271, [p - 1, p + 1]] = 255
+    for i in range(13):
+        p = 30 + i * 20
+        edges[[p - 1, p + 1], 30:391] = 255
+    grid = detect_grid(edges, [13, 19])
+
+    assert grid is not None
+    assert (len(grid['x']), len(grid['y'])) == (19, 13)
+    assert grid['confidence'] < MIN_GRID_CONFIDENCE
+
+def test_shift_grid_lines():
+    # Outer lines are weak, a strong frame edge next to the last line
+    # attracted the grid fitted to peaks by one spacing
+    profile = np.zeros(300, dtype = np.float32)
+    profile[20:261:20] = 10
+    profile[[20, 260]] = 2
+    profile[275] = 50
+
+    pos = np.arange(40, 281, 20, dtype = np.float64)
+    assert list(shift_grid_lines(profile, pos)) == list(range(20, 261, 20))
+    assert list(shift_grid_lines(profile, pos - 20)) == list(range(20, 261, 20))
+
+def test_profile_period():
+    # Spacing is found with subpixel accuracy, multiples of the period are not taken
+    profile = np.zeros(500, dtype = np.float32)
+    pos = np.round(15 + np.arange(19) * 24.5).astype(np.int64)
+    profile[pos] = 10
+    spacing, strength = profile_period(profile)
+    assert abs(spacing - 24.5) < 0.5
+    assert 0 < strength <= 1
+
+    assert abs(profile_phase(profile, spacing) - 15) <= 1
+
+def test_profile_period_flat():
+    assert profile_period(np.ones(500, dtype = np.float32)) == (None, None)
+
+def test_estimate_grid():
+    edges = grid_edges(19, 30, 20, (420, 420))
+    est = estimate_grid(edges, DEF_AVAIL_SIZES)
+
+    assert est is not None
+    assert est['size'] == 19
+    assert np.allclose(est['spacing'], [20, 20], atol = 0.5)
+    assert np.abs(np.array(est['edges']) - np.array([[30, 30], [390, 390]])).max() <= 1
+
+    # Board of another size is not snapped to 19
+    edges = grid_edges(13, 30, 20, (300, 300))
+    est = estimate_grid(edges, DEF_AVAIL_SIZES)
+    assert est['size'] == 13
+
+def test_grid_filter_lines():
+    est = {'spacing': [20, 20], 'phase': [10, 10], 'edges': [[30, 30], [390, 390]]}
+
+    # Lines in HoughLines format (rho, theta)
+    lines = np.array([[[50, 0]], [[57, 0]], [[110, 0]], [[390, 0]], [[450, 0]]], dtype = np.float32)
+    res = grid_filter_lines(lines, est, GR_X)
+
+    # Line off the grid and line outside of board are removed, missed first edge is added
+    assert sorted(res[:, 0, 0].tolist()) == [30, 50, 110, 390]
+
+def known_edges():
+    for file_name in sorted(glob.glob(os.path.join(IMG_DIR, '*.gpar'))):
+        with open(file_name) as f:
+            p = json.load(f)
+        if not p.get('BOARD_EDGES'):
+            continue
+        for img_file in glob.glob(os.path.splitext(file_name)[0] + '.*'):
+            if not img_file.endswith('.gpar'):
+                yield img_file, p
+
+def find_board_edges(img, p, grid_profile):
+    params = GrParams()
+    params.assign(p, copy_all = True)
+    params['BOARD_EDGES'] = None
+    params['GRID_PROFILE'] = grid_profile
+    edges, size = find_board(img, params, {GR_TIMINGS: dict()}, f_debug = False)
+    if edges is None or size != p['BOARD_SIZE']:
+        return None
+    return np.abs(np.array(edges) - np.array(p['BOARD_EDGES'])).max()
+
+def test_grid_profile_known_edges():
+    # Board edges set manually for sample images are a reference.
+    # Profile detection should be not less accurate than Hough one
+    logging.disable(logging.CRITICAL)
+    n_found = 0
+    for img_file, p in known_edges():
+        img = cv2.imread(img_file)
+        d_hough = find_board_edges(img, p, 0)
+        d_grid = find_board_edges(img, p, 1)
+
+        assert d_grid is not None, img_file
+        assert d_hough is None or d_grid <= d_hough + EDGES_TOLERANCE, img_file
+        if d_grid <= EDGES_TOLERANCE:
+            n_found += 1
+
+    logging.disable(logging.NOTSET)
+    assert n_found >= 15
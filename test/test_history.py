@@ -0,0 +1,87 @@
+#-------------------------------------------------------------------------------
+# Name:        Go board recognition project
+# Purpose:     Optimization history tests
+#
+# Author:      kol
+#
+# Created:     18.10.2026
+# Copyright:   (c) kol 2019-2026
+# Licence:     MIT
+#-------------------------------------------------------------------------------
+import os
+import sys
+import numpy as np
+from skopt.space import Integer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from gr.history import GrOptHistory, HISTORY_EXT
+
+SPACE = [Integer(1, 10, name = 'HC_BLUR'), Integer(50, 200, name = 'STONES_THRESHOLD_B')]
+
+class Metric(object):
+    pass
+
+def test_save_load(tmp_path):
+    file_name = tmp_path / ('board' + HISTORY_EXT)
+    history = GrOptHistory(file_name)
+    history.add('key', SPACE, [3, 100], 0.5, {'b': {'c': 0.5}}, 1.23456)
+    history.add('key', SPACE, [np.int64(4), np.int64(120)], np.float64(0.75), {'b': {'c': 0.75}}, 2.0)
+    history.save()
+    assert file_name.is_file()
+    assert not os.path.exists(str(file_name) + '.tmp')
+
+    loaded = GrOptHistory(file_name)
+    assert loaded.points('key') == history.points('key')
+    assert loaded.points('key')[0] == {'x': [3, 100], 'q': 0.5, 'metrics': {'b': {'c': 0.5}}, 'time': 1.235}
+
+    # Points are found by tuple index after loading, numpy values match plain ones
+    assert loaded.find('key', [4, 120])['q'] == 0.75
+    assert loaded.find('key', np.array([3, 100]))['q'] == 0.5
+    assert loaded.find('key', [5, 120]) is None
+    assert loaded.find('other', [3, 100]) is None
+    assert loaded.points('other') == []
+
+def test_add_after_load(tmp_path):
+    file_name = tmp_path / ('board' + HISTORY_EXT)
+    history = GrOptHistory(file_name)
+    history.add('key', SPACE, [3, 100], 0.5, {}, 1.0)
+    history.save()
+
+    history = GrOptHistory(file_name)
+    history.add('key', SPACE, [4, 100], 0.6, {}, 1.0)
+    history.add('key2', SPACE, [4, 100], 0.7, {}, 1.0)
+    history.save()
+
+    loaded = GrOptHistory(file_name)
+    assert [p['x'] for p in loaded.points('key')] == [[3, 100], [4, 100]]
+    assert loaded.find('key2', [4, 100])['q'] == 0.7
+
+def test_memory_only():
+    history = GrOptHistory()
+    history.add('key', SPACE, [3, 100], 0.5, {}, 1.0)
+    history.save()
+    assert history.find('key', [3, 100])['q'] == 0.5
+
+def test_damaged_file(tmp_path):
+    file_name = tmp_path / ('board' + HISTORY_EXT)
+    file_name.write_text('{"runs": ')
+    history = GrOptHistory(file_name)
+    assert history.points('key') == []
+
+def test_make_key():
+    img = np.zeros((20, 20, 3), dtype = np.uint8)
+    key = GrOptHistory.make_key(img, SPACE, {'BOARD_SIZE': 19})
+
+    assert key == GrOptHistory.make_key(img.copy(), SPACE, {'BOARD_SIZE': 19})
+    assert key == GrOptHistory.make_key(img, SPACE, {'BOARD_SIZE': np.int64(19)})
+
+    # Any change of image, space, fixed parameters or metrics makes a new run
+    img2 = img.copy()
+    img2[0, 0, 0] = 1
+    assert key != GrOptHistory.make_key(img2, SPACE, {'BOARD_SIZE': 19})
+    assert key != GrOptHistory.make_key(img, SPACE[:1], {'BOARD_SIZE': 19})
+    assert key != GrOptHistory.make_key(img, [Integer(1, 11, name = 'HC_BLUR'), SPACE[1]], {'BOARD_SIZE': 19})
+    assert key != GrOptHistory.make_key(img, SPACE, {'BOARD_SIZE': 13})
+    assert key != GrOptHistory.make_key(img, SPACE, {'BOARD_SIZE': 19}, [(Metric, 1.0, None)])
+    assert GrOptHistory.make_key(img, SPACE, {'BOARD_SIZE': 19}, [(Metric, 1.0, None)]) != \
+        GrOptHistory.make_key(img, SPACE, {'BOARD_SIZE': 19}, [(Metric, 2.0, None)])
@@ -0,0 +1,139 @@
+#-------------------------------------------------------------------------------
+# Name:        Go board recognition project
+# Purpose:     Stones sampling tests
+#
+# Author:      kol
+#
+# Created:     18.10.2026
+# Copyright:   (c) kol 2019-2026
+# Licence:     MIT
+#-------------------------------------------------------------------------------
+import os
+import sys
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from gr.grdef import *
+from gr.sampling import intersections, box_mean, stones_integral, sample_stones, match_stones, \
+    MIN_TEMPLATE_STONES
+
+# Results dictionary of a 9x9 board with 30 pixels spacing starting at 40
+def board_res(size = 9, origin = 40, spacing = 30):
+    last = origin + (size - 1) * spacing
+    return {GR_EDGES: ((origin, origin), (last, last)),
+            GR_BOARD_SIZE: size,
+            GR_SPACING: (spacing, spacing)}
+
+# Make a board image with stones drawn at given positions
+def board_img(res, black, white):
+    size = res[GR_BOARD_SIZE]
+    last = res[GR_EDGES][1][0] + res[GR_EDGES][0][0]
+    img = np.full((last, last, 3), (80, 170, 220), dtype = np.uint8)
+    r = int(min(res[GR_SPACING]) * 0.45)
+    for stones, color in ((black, (20, 20, 20)), (white, (240, 240, 240))):
+        for a, b in stones:
+            x = res[GR_EDGES][0][0] + (a - 1) * res[GR_SPACING][GR_X]
+            y = res[GR_EDGES][0][1] + (size - b) * res[GR_SPACING][GR_Y]
+            cv2.circle(img, (x, y), r, color, -1)
+    return img
+
+def test_intersections():
+    res = board_res()
+    p = intersections(res)
+    assert p.shape == (81, 4)
+
+    # Position A1 is at the bottom left corner, as convert_xy() makes it
+    a1 = p[(p[:, GR_A] == 1) & (p[:, GR_B] == 1)][0]
+    assert tuple(a1[[GR_X, GR_Y]]) == (40, 280)
+    j9 = p[(p[:, GR_A] == 9) & (p[:, GR_B] == 9)][0]
+    assert tuple(j9[[GR_X, GR_Y]]) == (280, 40)
+
+    assert len(set(map(tuple, p[:, [GR_A, GR_B]]))) == 81
+
+def test_box_mean():
+    img = np.random.RandomState(0).randint(0, 256, (100, 120)).astype(np.uint8)
+    sums = cv2.integral(img)
+    points = np.array([[50, 40], [10, 80], [0, 0], [119, 99]], dtype = np.float64)
+
+    m = box_mean(sums, points, 5)
+    assert np.isclose(m[0], np.mean(img[35:46, 45:56]))
+    assert np.isclose(m[1], np.mean(img[75:86, 5:16]))
+
+    # Boxes are clipped at image borders
+    assert np.isclose(m[2], np.mean(img[0:6, 0:6]))
+    assert np.isclose(m[3], np.mean(img[94:100, 114:120]))
+
+def test_stones_integral():
+    res = board_res()
+    img = board_img(res, [(1, 1)], [(9, 9)])
+
+    # Integral of the mask counts stone pixels
+    sums_b = stones_integral(img, STONE_BLACK, 80)
+    sums_w = stones_integral(img, STONE_WHITE, 180)
+    n = np.sum(np.all(img == (20, 20, 20), axis = 2))
+    assert sums_b[-1, -1] == n
+    n = np.sum(np.all(img == (240, 240, 240), axis = 2))
+    assert sums_w[-1, -1] == n
+
+def test_sample_stones():
+    res = board_res()
+    black = [(1, 1), (3, 7), (5, 5)]
+    white = [(9, 9), (4, 2)]
+    img = board_img(res, black, white)
+
+    stones = sample_stones(stones_integral(img, STONE_BLACK, 80), res)
+    assert sorted(map(tuple, stones[:, [GR_A, GR_B]])) == sorted(black)
+    assert np.all(stones[:, GR_R] == round(30 * 0.45))
+
+    stones = sample_stones(stones_integral(img, STONE_WHITE, 180), res)
+    assert sorted(map(tuple, stones[:, [GR_A, GR_B]])) == sorted(white)
+    assert list(stones[stones[:, GR_A] == 9][0, [GR_X, GR_Y]]) == [280, 40]
+
+def test_sample_stones_empty():
+    res = board_res()
+    img = board_img(res, [], [])
+    assert sample_stones(stones_integral(img, STONE_BLACK, 80), res) is None
+
+    # Nothing is sampled until board grid is known
+    assert sample_stones(stones_integral(img, STONE_BLACK, 80), {}) is None
+
+# Stones (X, Y, A, B, R) as previous filters return them
+def found_stones(res, stones):
+    size = res[GR_BOARD_SIZE]
+    return np.array([[res[GR_EDGES][0][0] + (a - 1) * res[GR_SPACING][GR_X],
+                      res[GR_EDGES][0][1] + (size - b) * res[GR_SPACING][GR_Y],
+                      a, b, 13] for a, b in stones], dtype = np.int64)
+
+def test_match_stones():
+    # Stones missed by previous filters are found by template made of found ones
+    res = board_res()
+    black = [(2, 2), (3, 7), (5, 5), (7, 3), (8, 8)]
+    img = board_img(res, black, [(4, 2)])
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    stones, dbg_img = match_stones(gray, found_stones(res, black[:3]), res, 0.8)
+    assert dbg_img is not None
+    assert sorted(map(tuple, stones[:, :2])) == \
+        sorted(map(tuple, found_stones(res, black)[:, [GR_X, GR_Y]]))
+    assert np.all(stones[:, 2] == 13)
+
+def test_match_stones_downscale():
+    # Large spacing makes template larger than MAX_TEMPLATE_SIZE
+    res = board_res(origin = 60, spacing = 80)
+    black = [(2, 2), (3, 7), (5, 5), (7, 3)]
+    img = board_img(res, black, [])
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    stones, _ = match_stones(gray, found_stones(res, black[:3]), res, 0.8)
+    assert len(stones) == len(black)
+
+def test_match_stones_no_template():
+    res = board_res()
+    black = [(2, 2), (3, 7), (5, 5)]
+    gray = cv2.cvtColor(board_img(res, black, []), cv2.COLOR_BGR2GRAY)
+    stones = found_stones(res, black[:MIN_TEMPLATE_STONES - 1])
+
+    assert match_stones(gray, stones, res, 0.8) == (None, None)
+    assert match_stones(gray, None, res, 0.8) == (None, None)
+    assert match_stones(gray, found_stones(res, black), {}, 0.8) == (None, None)